@@ -0,0 +1,165 @@
+"""Загрузка спрайтов: один раз на (путь, высоту), атлас и кэш на диске.
+
+Каждая пара (путь, целевая высота) декодируется и масштабируется один раз
+на весь процесс и раздается всем игрокам. Отмасштабированные кадры
+упаковываются в один атлас, который сохраняется на диск сырыми RGBA-байтами
+вместе с индексом. Ключ кадра включает mtime и размер исходного файла и
+высоту, поэтому при следующем запуске PNG не декодируется и smoothscale не
+вызывается, а изменившийся спрайт просто пересобирает атлас.
+"""
+import os
+import json
+
+import pygame
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sprite_cache")
+ATLAS_WIDTH = 1024
+ATLAS_VERSION = 1
+
+def load_and_scale(path, target_h):
+    try:
+        img = pygame.image.load(path)
+        if pygame.display.get_surface() is not None:
+            img = img.convert_alpha()
+        scale = target_h / img.get_height()
+        new_w = int(img.get_width() * scale)
+        new_h = int(img.get_height() * scale)
+        return pygame.transform.smoothscale(img, (new_w, new_h))
+    except (pygame.error, OSError):
+        surf = pygame.Surface((40, 60))
+        surf.fill((255, 0, 255))
+        return surf
+
+def pack_shelves(sizes, width=ATLAS_WIDTH):
+    """Раскладывает прямоугольники полками (строками) слева направо.
+
+    Возвращает (позиции в исходном порядке, высота атласа).
+    """
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [None] * len(sizes)
+    x = y = shelf_h = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > width and x > 0:
+            y += shelf_h
+            x = shelf_h = 0
+        positions[i] = (x, y)
+        x += w
+        shelf_h = max(shelf_h, h)
+    return positions, y + shelf_h
+
+class AssetManager:
+    """Общий для всех игроков кэш отмасштабированных спрайтов"""
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.scaled = {}   # (путь, высота) -> Surface
+        self.flipped = {}  # (путь, высота) -> отраженный Surface
+        self.atlas = None
+        self.from_disk = False
+
+    @staticmethod
+    def cache_key(path, target_h):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{target_h:.3f}"
+
+    def preload(self, items):
+        """Загружает пачку (путь, высота) - из атласа на диске или из PNG"""
+        items = [item for item in dict.fromkeys(items) if item not in self.scaled]
+        if not items:
+            return
+        keys = {item: self.cache_key(*item) for item in items}
+
+        index = self.read_index()
+        frames = index['frames'] if index else {}
+        if all(key is None or key in frames for key in keys.values()):
+            atlas = self.read_atlas(index) if frames else None
+            if atlas is not None or not frames:
+                for item, key in keys.items():
+                    if key is None:
+                        self.scaled[item] = load_and_scale(*item)
+                    else:
+                        self.scaled[item] = atlas.subsurface(pygame.Rect(frames[key]))
+                self.atlas = atlas
+                self.from_disk = True
+                return
+
+        # Кэш устарел или его нет: декодируем, масштабируем и пересобираем атлас
+        for item in items:
+            self.scaled[item] = load_and_scale(*item)
+        self.write_atlas()
+
+    def sprite(self, path, target_h, flip=False):
+        item = (path, target_h)
+        surf = self.scaled.get(item)
+        if surf is None:
+            surf = self.scaled[item] = load_and_scale(path, target_h)
+        if not flip:
+            return surf
+        flipped = self.flipped.get(item)
+        if flipped is None:
+            flipped = self.flipped[item] = pygame.transform.flip(surf, True, False)
+        return flipped
+
+    # --- ДИСК ---
+    def index_path(self):
+        return os.path.join(self.cache_dir, "atlas.json")
+
+    def atlas_path(self):
+        return os.path.join(self.cache_dir, "atlas.rgba")
+
+    def read_index(self):
+        try:
+            with open(self.index_path(), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != ATLAS_VERSION:
+            return None
+        return index
+
+    def read_atlas(self, index):
+        try:
+            with open(self.atlas_path(), "rb") as f:
+                data = f.read()
+            atlas = pygame.image.frombytes(data, tuple(index['size']), "RGBA")
+        except (OSError, ValueError, pygame.error):
+            return None
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        return atlas
+
+    def write_atlas(self):
+        """Упаковывает все загруженные кадры в атлас и сохраняет его на диск"""
+        entries = [(item, surf) for item, surf in self.scaled.items()
+                   if self.cache_key(*item) is not None]
+        if not entries:
+            return
+        positions, height = pack_shelves([surf.get_size() for _, surf in entries])
+        atlas = pygame.Surface((ATLAS_WIDTH, height), pygame.SRCALPHA)
+        frames = {}
+        for (item, surf), pos in zip(entries, positions):
+            # MAX по нулевому фону - точная копия пикселей, без смешивания альфы
+            atlas.blit(surf, pos, special_flags=pygame.BLEND_RGBA_MAX)
+            frames[self.cache_key(*item)] = [pos[0], pos[1], surf.get_width(), surf.get_height()]
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.atlas_path(), "wb") as f:
+                f.write(pygame.image.tobytes(atlas, "RGBA"))
+            with open(self.index_path(), "w", encoding="utf-8") as f:
+                json.dump({'version': ATLAS_VERSION, 'size': [ATLAS_WIDTH, height], 'frames': frames}, f)
+        except OSError:
+            # Кэш - только ускорение; без записи на диск игра работает как раньше
+            return
+
+        # Дальше кадры берутся из атласа, чтобы не держать две копии
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        self.atlas = atlas
+        for item, _ in entries:
+            self.scaled[item] = atlas.subsurface(pygame.Rect(frames[self.cache_key(*item)]))
+
+assets = AssetManager()
@@ -0,0 +1,254 @@
+"""Пакетная симуляция для ботов и обучения: N миров, состояние в массивах NumPy.
+
+В каждом мире один игрок на своем уровне из generate_level. Позиции,
+скорости, on_ground, coyote_timer и направление взгляда всех миров лежат
+в массивах, и шаг считается сразу для всех: те же гравитация, приземление,
+удар головой и coyote time, что в Player.update, с тем же округлением
+координат, что у pygame.Rect. Платформы миров - матрицы (мир, платформа).
+
+    sim = BatchSim(4096, seed=0)
+    obs = sim.reset()
+    obs, done = sim.step(actions)   # actions - биты INPUT_* на каждый мир
+    sim.reset(done)                 # новые уровни только закончившимся мирам
+
+    python batchsim.py [миров] [тиков]   # скорость шага
+    python batchsim.py --check           # сверка с Player на случайном вводе
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from simulation import (GRAVITY, JUMP_FORCE, MOVE_SPEED, MAX_FALL_SPEED, COYOTE_TICKS,
+                        LAND_TOLERANCE, GROUND_Y, PLAYER_SIZES, PLAYER_START_X,
+                        INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, Player, generate_level)
+
+# Пустое место в матрице платформ: ширина 0 и далеко справа - ни с чем не пересекается
+NO_PLATFORM = 1 << 40
+# Колонки наблюдения
+OBS_FIELDS = ('x', 'y', 'vel_x', 'vel_y', 'on_ground', 'coyote_timer', 'look_right')
+
+def round_rect(v):
+    """Округление, как при присваивании float в pygame.Rect (половина - от нуля)"""
+    return np.trunc(v + np.copysign(0.5, v)).astype(np.int64)
+
+class BatchSim:
+    def __init__(self, worlds, platform_count=15, size=PLAYER_SIZES[0], start_x=PLAYER_START_X[0],
+                 seed=None, max_ticks=None):
+        self.n = worlds
+        self.platform_count = platform_count
+        self.w, self.h = size
+        self.start_x = start_x
+        self.max_ticks = max_ticks
+        self.seeds = random.Random(seed)
+
+        n = worlds
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.vel_x = np.zeros(n, dtype=np.int64)
+        self.vel_y = np.zeros(n, dtype=np.float64)  # float64, как float у Player
+        self.on_ground = np.zeros(n, dtype=bool)
+        self.coyote_timer = np.zeros(n, dtype=np.int64)
+        self.look_right = np.ones(n, dtype=bool)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.won = np.zeros(n, dtype=bool)
+        self.died = np.zeros(n, dtype=bool)
+        self.moving = np.zeros(n, dtype=bool)
+        self.spawn_y = np.zeros(n, dtype=np.int64)
+        self.level_seeds = np.zeros(n, dtype=np.uint32)
+
+        # Платформы: (мир, платформа); все уровни одной длины, но запас не мешает
+        self.p_left = np.full((n, 0), NO_PLATFORM, dtype=np.int64)
+        self.p_top = np.zeros((n, 0), dtype=np.int64)
+        self.p_right = np.full((n, 0), NO_PLATFORM, dtype=np.int64)
+        self.p_bottom = np.zeros((n, 0), dtype=np.int64)
+        self.exit_zone = np.zeros((n, 4), dtype=np.int64)  # left, top, right, bottom
+
+    # --- УРОВНИ ---
+    def grow_platforms(self, count):
+        extra = count - self.p_left.shape[1]
+        if extra <= 0:
+            return
+        pad = ((0, 0), (0, extra))
+        self.p_left = np.pad(self.p_left, pad, constant_values=NO_PLATFORM)
+        self.p_top = np.pad(self.p_top, pad)
+        self.p_right = np.pad(self.p_right, pad, constant_values=NO_PLATFORM)
+        self.p_bottom = np.pad(self.p_bottom, pad)
+
+    def load_level(self, i, level):
+        """Кладет уровень в строку i матриц платформ"""
+        rects = level.platforms.rects
+        self.grow_platforms(len(rects))
+        k = len(rects)
+        self.p_left[i, :k] = [r.left for r in rects]
+        self.p_top[i, :k] = [r.top for r in rects]
+        self.p_right[i, :k] = [r.right for r in rects]
+        self.p_bottom[i, :k] = [r.bottom for r in rects]
+        self.p_left[i, k:] = NO_PLATFORM
+        self.p_right[i, k:] = NO_PLATFORM
+        ez = level.exit_zone
+        self.exit_zone[i] = (ez.left, ez.top, ez.right, ez.bottom)
+        self.spawn_y[i] = level.spawn_y
+        self.level_seeds[i] = level.seed
+
+    def reset(self, mask=None):
+        """Новый уровень и респаун для миров из mask (по умолчанию - для всех)"""
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        for i in idx.tolist():
+            self.load_level(i, generate_level(self.platform_count, seed=self.seeds.getrandbits(32)))
+        self.respawn(idx)
+        return self.observe()
+
+    def respawn(self, idx):
+        """Игроки миров idx - в начало их текущих уровней, как Player.reset"""
+        self.x[idx] = self.start_x
+        self.y[idx] = self.spawn_y[idx] - self.h
+        self.vel_x[idx] = 0
+        self.vel_y[idx] = 0
+        self.on_ground[idx] = False
+        self.coyote_timer[idx] = 0
+        self.look_right[idx] = True
+        self.ticks[idx] = 0
+        self.won[idx] = False
+        self.died[idx] = False
+
+    # --- ШАГ ---
+    def overlaps(self):
+        """Маска (мир, платформа): хитбокс пересекает платформу (как colliderect)"""
+        x = self.x[:, None]
+        y = self.y[:, None]
+        return ((x < self.p_right) & (x + self.w > self.p_left) &
+                (y < self.p_bottom) & (y + self.h > self.p_top))
+
+    def step(self, actions):
+        """Один тик во всех мирах; возвращает (наблюдения, done)"""
+        actions = np.asarray(actions)
+        left = (actions & INPUT_LEFT) != 0
+        right = (actions & INPUT_RIGHT) != 0
+        rows = np.arange(self.n)
+
+        # Прыжок до шага, как apply_input -> try_jump
+        jump = ((actions & INPUT_JUMP) != 0) & (self.on_ground | (self.coyote_timer > 0))
+        self.vel_y[jump] = JUMP_FORCE
+        self.on_ground[jump] = False
+        self.coyote_timer[jump] = 0
+
+        # Горизонталь: правый флаг перекрывает левый
+        self.vel_x = np.where(right, MOVE_SPEED, np.where(left, -MOVE_SPEED, 0))
+        self.look_right = np.where(right, True, np.where(left, False, self.look_right))
+        moving = left | right
+        self.x += self.vel_x
+
+        # Платформы не перекрываются, поэтому последовательные сдвиги Player.update
+        # сводятся к ближайшему краю среди задетых платформ
+        hit = self.overlaps()
+        if hit.any():
+            hit_right = hit & (self.vel_x > 0)[:, None]
+            hit_left = hit & (self.vel_x < 0)[:, None]
+            stop_right = np.where(hit_right, self.p_left, NO_PLATFORM).min(axis=1)
+            stop_left = np.where(hit_left, self.p_right, -NO_PLATFORM).max(axis=1)
+            self.x = np.where(hit_right.any(axis=1), stop_right - self.w,
+                              np.where(hit_left.any(axis=1), stop_left, self.x))
+
+        # Гравитация
+        self.vel_y = np.minimum(self.vel_y + GRAVITY, MAX_FALL_SPEED)
+        old_y = self.y
+        self.y = round_rect(self.y + self.vel_y)
+
+        # Вертикаль: срабатывает первая задетая платформа, которая подходит
+        # под приземление или удар головой (после нее vel_y = 0)
+        was_on_ground = self.on_ground
+        hit = self.overlaps()
+        falling = (self.vel_y > 0)[:, None]
+        rising = (self.vel_y < 0)[:, None]
+        land = hit & falling & ((old_y + self.h)[:, None] <= self.p_top + LAND_TOLERANCE)
+        bump = hit & rising & (old_y[:, None] >= self.p_bottom - LAND_TOLERANCE)
+        first = (land | bump).argmax(axis=1)
+        landed = land[rows, first]
+        bumped = bump[rows, first]
+        self.y = np.where(landed, self.p_top[rows, first] - self.h,
+                          np.where(bumped, self.p_bottom[rows, first], self.y))
+        self.vel_y[landed | bumped] = 0
+        self.on_ground = landed
+
+        # Coyote time
+        left_edge = ~self.on_ground & was_on_ground
+        self.coyote_timer = np.where(landed | left_edge, COYOTE_TICKS,
+                                     np.where(~self.on_ground & (self.coyote_timer > 0),
+                                              self.coyote_timer - 1, self.coyote_timer))
+
+        # Лава и выход
+        self.ticks += 1
+        self.died = self.y > GROUND_Y + 50
+        ez = self.exit_zone
+        self.won = ((self.x < ez[:, 2]) & (self.x + self.w > ez[:, 0]) &
+                    (self.y < ez[:, 3]) & (self.y + self.h > ez[:, 1]))
+        done = self.died | self.won
+        if self.max_ticks is not None:
+            done |= self.ticks >= self.max_ticks
+        self.moving = moving
+        return self.observe(), done
+
+    def observe(self):
+        """Наблюдения (мир, OBS_FIELDS) в float32"""
+        return np.stack([self.x, self.y, self.vel_x, self.vel_y, self.on_ground,
+                         self.coyote_timer, self.look_right], axis=1).astype(np.float32)
+
+# --- СВЕРКА С Player ---
+def check_against_player(worlds=64, ticks=2000, seed=0):
+    """Гоняет BatchSim и Player на одном случайном вводе; возвращает число расхождений"""
+    rng = np.random.default_rng(seed)
+    batch = BatchSim(worlds, seed=seed)
+    batch.reset()
+    players = []
+    levels = []
+    for i in range(worlds):
+        level = generate_level(batch.platform_count, seed=int(batch.level_seeds[i]))
+        p = Player(batch.start_x, (batch.w, batch.h))
+        p.reset(level.spawn_y)
+        players.append(p)
+        levels.append(level)
+
+    mismatches = 0
+    for _ in range(ticks):
+        # Чаще вправо, чтобы миры доходили до дальних платформ
+        actions = rng.choice([0, INPUT_RIGHT, INPUT_RIGHT | INPUT_JUMP, INPUT_LEFT, INPUT_JUMP],
+                             size=worlds, p=[0.1, 0.5, 0.2, 0.1, 0.1])
+        _, done = batch.step(actions)
+        for i, (p, level) in enumerate(zip(players, levels)):
+            p.apply_input(int(actions[i]))
+            p.update(level.platforms)
+            if (p.rect.x, p.rect.y, p.vel_y, p.on_ground, p.coyote_timer, p.look_right) != (
+                    batch.x[i], batch.y[i], batch.vel_y[i], batch.on_ground[i],
+                    batch.coyote_timer[i], batch.look_right[i]):
+                mismatches += 1
+        # Закончившие миры начинают тот же уровень заново
+        idx = np.flatnonzero(done)
+        for i in idx.tolist():
+            players[i].reset(levels[i].spawn_y)
+        batch.respawn(idx)
+    return mismatches
+
+if __name__ == "__main__" and "--check" in sys.argv:
+    mismatches = check_against_player()
+    print(f"BatchSim vs Player: {mismatches} mismatching world-ticks")
+    sys.exit(1 if mismatches else 0)
+
+elif __name__ == "__main__":
+    worlds = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    sim = BatchSim(worlds, seed=0)
+    sim.reset()
+    rng = np.random.default_rng(0)
+    actions = rng.choice([INPUT_RIGHT, INPUT_RIGHT | INPUT_JUMP], size=(ticks, worlds), p=[0.9, 0.1])
+    episodes = 0
+    start = time.perf_counter()
+    for t in range(ticks):
+        _, done = sim.step(actions[t])
+        if done.any():
+            episodes += int(done.sum())
+            sim.reset(done)
+    elapsed = time.perf_counter() - start
+    print(f"{worlds} worlds x {ticks} ticks in {elapsed:.2f} s: {worlds * ticks / elapsed:.0f} world-steps/s, "
+          f"episodes finished: {episodes}")
@@ -0,0 +1,428 @@
+"""Бенчмарки подсистем без окна: SDL dummy, фиксированные сиды, сравнение с эталоном.
+
+    python bench.py                    # прогон и сравнение с bench_baseline.json
+    python bench.py -k draw            # только кейсы, в имени которых есть "draw"
+    python bench.py --update-baseline  # записать текущие результаты как эталон
+    python bench.py --threshold 1.5    # допустимое замедление (по умолчанию 1.3x)
+
+Цифры зависят от машины, поэтому эталон снимается на той же машине, где
+идет проверка. Кейс считается регрессией, если его ns/op больше эталонного
+в threshold раз; тогда процесс завершается с кодом 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import platform
+import tempfile
+import subprocess
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import movement
+from movement import (draw_platforms, draw_lava, draw_game, draw_ui, sprite_items,
+                      PlayerSprites, DirtyRenderer, SKIN_P1, SKIN_P2, KEY_MAPS, dispatch_key,
+                      COLOR_BRICK_MAIN, COLOR_BRICK_MORTAR)
+from simulation import (SCREEN_WIDTH, SCREEN_HEIGHT, CHAR_SCALE, PLAYER_SIZES, PLAYER_START_X,
+                        INPUT_RIGHT, INPUT_JUMP,
+                        Player, PlayerRegistry, Simulation, EndlessLevels, generate_level, edge_jump_bot)
+from particles import LavaParticles, CloudField
+from assets import AssetManager, load_and_scale
+from batchsim import BatchSim
+from profiler import profiler
+from quality import QUALITY_LEVELS
+from levelfile import save_level, load_level, synthetic_level
+from ghost import TraceRecorder, TraceFile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, "bench_baseline.json")
+DEFAULT_THRESHOLD = 1.3
+MIN_RUN_TIME = 0.05  # сек на один замер
+REPEATS = 5          # берем лучший из замеров
+
+CASES = []  # (имя, setup, аргументы, кадр ли это)
+
+# Окно (dummy) нужно кейсам отрисовки; запуск игры меряется отдельным процессом
+screen = movement.startup()
+
+def add_case(name, setup, *args, frame=False):
+    CASES.append((name, setup, args, frame))
+
+def measure(op):
+    """Лучшее время одной операции в нс; число повторов подбирается под MIN_RUN_TIME"""
+    n = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(n):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_TIME:
+            break
+        n *= 2 if elapsed <= 0 else max(2, min(10, int(MIN_RUN_TIME / elapsed) + 1))
+    best = elapsed / n
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(n):
+            op()
+        best = min(best, (time.perf_counter() - start) / n)
+    return best * 1e9
+
+# --- КЕЙСЫ ---
+class RepeatLevel:
+    """Источник уровней для Simulation: всегда один и тот же уровень (без генерации в замере)"""
+    def __init__(self, level):
+        self.level = level
+
+    def take(self, index):
+        return self.level
+
+LEVELS = {}
+
+def make_sim(players, platform_count, swept=False):
+    # Длинные уровни строим один раз на все кейсы
+    level = LEVELS.get(platform_count)
+    if level is None:
+        level = LEVELS[platform_count] = generate_level(platform_count, seed=0)
+    sim = Simulation([Player(PLAYER_START_X[i % 2] + 20 * (i // 2), PLAYER_SIZES[i % 2]) for i in range(players)],
+                     rng=random.Random(0), levels=RepeatLevel(level), swept=swept)
+    return sim
+
+def setup_generate_level(platform_count):
+    seeds = itertools.count()
+    return lambda: generate_level(platform_count, seed=next(seeds))
+
+def setup_sim_step(players, platform_count, swept=False, dt=1):
+    """Шаг логики; dt > 1 - один шаг на dt тиков (сплошные коллизии)"""
+    sim = make_sim(players, platform_count, swept)
+    def op():
+        edge_jump_bot(sim)
+        sim.step(dt)
+        if sim.won:
+            sim.new_level()
+    return op
+
+def level_file(platform_count):
+    """Файл уровня generate_level(platform_count, seed=0) во временной папке (один раз)"""
+    path = os.path.join(tempfile.gettempdir(), f"bench_level_{platform_count}.bin")
+    if not os.path.exists(path):
+        save_level(make_sim(1, platform_count).level, path)
+    return path
+
+def setup_key_dispatch(players):
+    """Событие клавиатуры: поиск по таблице клавиш реестра и флаги игрока"""
+    registry = PlayerRegistry(Player(0, keys_map=KEY_MAPS[i % len(KEY_MAPS)]) for i in range(players))
+    table = registry.key_table()
+    events = itertools.cycle([(key, pressed) for keys in KEY_MAPS for action in ('left', 'right')
+                              for key in keys[action] for pressed in (True, False)])
+    def op():
+        key, pressed = next(events)
+        dispatch_key(table, key, pressed)
+    return op
+
+def setup_level_open(platform_count):
+    """Открытие файла уровня: mmap и заголовок, без разбора платформ"""
+    path = os.path.join(tempfile.gettempdir(), f"bench_level_synthetic_{platform_count}.bin")
+    save_level(synthetic_level(platform_count), path)
+    return lambda: load_level(path)
+
+def setup_sim_step_file(players, platform_count):
+    """Тик на уровне из файла: коллизии читают платформы из mmap"""
+    level = load_level(level_file(platform_count))
+    sim = Simulation([Player(PLAYER_START_X[i % 2] + 20 * (i // 2), PLAYER_SIZES[i % 2]) for i in range(players)],
+                     rng=random.Random(0), levels=RepeatLevel(level))
+    def op():
+        edge_jump_bot(sim)
+        sim.step()
+        if sim.won:
+            sim.new_level()
+    return op
+
+def setup_sim_endless(players):
+    """Бесконечный уровень: тик включает достройку и выброс чанков"""
+    sim = Simulation([Player(PLAYER_START_X[i % 2] + 20 * (i // 2), PLAYER_SIZES[i % 2]) for i in range(players)],
+                     levels=EndlessLevels(0))
+    def op():
+        edge_jump_bot(sim)
+        sim.step()
+    return op
+
+def setup_batch_step(worlds):
+    """Тик пакетной симуляции во всех мирах (без генерации уровней в замере)"""
+    sim = BatchSim(worlds, seed=0)
+    sim.reset()
+    rng = np.random.default_rng(0)
+    actions = itertools.cycle(rng.choice([INPUT_RIGHT, INPUT_RIGHT | INPUT_JUMP], size=(256, worlds), p=[0.9, 0.1]))
+    def op():
+        _, done = sim.step(next(actions))
+        sim.respawn(np.flatnonzero(done))
+    return op
+
+def setup_snapshot(mode, players):
+    sim = make_sim(players, 15)
+    for _ in range(100):
+        edge_jump_bot(sim)
+        sim.step()
+    data = sim.snapshot()
+    if mode == "save":
+        return sim.snapshot
+    return lambda: sim.restore(data)
+
+def setup_trace_record(players):
+    """Тик с записью траекторий (TraceRecorder пишет во временный файл)"""
+    sim = make_sim(players, 15)
+    recorder = TraceRecorder(os.path.join(tempfile.gettempdir(), f"bench_trace_{players}.trc"), sim)
+    def op():
+        edge_jump_bot(sim)
+        sim.step()
+        recorder.record(sim)
+        if sim.won:
+            sim.new_level()
+    return op
+
+def setup_trace_seek(ticks):
+    """Случайный переход по файлу траекторий: индекс блоков и декод одного блока"""
+    path = os.path.join(tempfile.gettempdir(), "bench_trace_seek.trc")
+    sim = make_sim(2, 15)
+    recorder = TraceRecorder(path, sim)
+    for _ in range(ticks):
+        edge_jump_bot(sim)
+        sim.step()
+        recorder.record(sim)
+        if sim.won:
+            sim.new_level()
+    recorder.close()
+    trace = TraceFile(path)
+    rng = random.Random(0)
+    def op():
+        trace.cache.clear()
+        trace.state_at(rng.randrange(trace.first_ticks[0], trace.first_ticks[-1]))
+    return op
+
+def camera_sweep(level):
+    span = max(1, min(level.end_x, 20000) - SCREEN_WIDTH)
+    return itertools.cycle(range(0, span, 7))
+
+def setup_draw_platforms(platform_count):
+    level = generate_level(platform_count, seed=0)
+    cams = camera_sweep(level)
+    return lambda: draw_platforms(screen, level.platforms, next(cams))
+
+def draw_platforms_per_brick(surface, platforms, cam_x):
+    """Старая отрисовка: каждый кирпич каждый кадр (эталон для сравнения с запеканием)"""
+    brick_w, brick_h = 30, 15
+
+    for p in platforms:
+        if p.right < cam_x - 100 or p.left > cam_x + SCREEN_WIDTH + 100:
+            continue
+
+        rect_draw = pygame.Rect(p.x - int(cam_x), p.y, p.width, p.height)
+        pygame.draw.rect(surface, COLOR_BRICK_MORTAR, rect_draw)
+
+        rows = (p.height // brick_h) + 1
+        for row in range(rows):
+            y_pos = row * brick_h
+            x_shift = (brick_w // 2) if row % 2 else 0
+
+            cols = (p.width + x_shift) // brick_w + 1
+            for col in range(cols):
+                brick_rect = pygame.Rect(col * brick_w - x_shift + 2, y_pos + 2, brick_w - 4, brick_h - 4)
+                platform_bounds = pygame.Rect(0, 0, p.width, p.height)
+                clipped = brick_rect.clip(platform_bounds)
+
+                if clipped.width > 0 and clipped.height > 0:
+                    screen_rect = pygame.Rect(p.x + clipped.x - int(cam_x), p.y + clipped.y, clipped.width, clipped.height)
+                    pygame.draw.rect(surface, COLOR_BRICK_MAIN, screen_rect)
+
+def setup_draw_platforms_per_brick(platform_count):
+    level = generate_level(platform_count, seed=0)
+    cams = camera_sweep(level)
+    return lambda: draw_platforms_per_brick(screen, level.platforms, next(cams))
+
+def setup_lava(capacity):
+    bubbles = LavaParticles(capacity, spawn_rate=max(1, capacity // 20), rng=np.random.default_rng(0))
+    movement.lava = bubbles
+    for _ in range(60):
+        bubbles.update()
+    def op():
+        bubbles.update()
+        draw_lava(screen, 0)
+    return op
+
+def setup_clouds(count):
+    field = CloudField(count, rng=np.random.default_rng(0))
+    def op():
+        field.update()
+        field.draw(screen)
+    return op
+
+def setup_full_frame(players, platform_count, mode="flip", bot=True, quality="high", parallax=None):
+    """Тик логики + весь кадр + вывод, как в главном цикле.
+
+    mode "dirty" - DirtyRenderer и display.update(rects); без bot игроки
+    стоят, и камера не двигается. quality - уровень из QUALITY_LEVELS,
+    parallax - включить или выключить слои параллакса поверх него.
+    """
+    sim = make_sim(players, platform_count)
+    skins = [PlayerSprites(SKIN_P1 if i % 2 == 0 else SKIN_P2) for i in range(players)]
+    movement.clouds = CloudField(5, rng=np.random.default_rng(0))
+    movement.lava = LavaParticles(20, rng=np.random.default_rng(0))
+    settings = dict(next(q for q in QUALITY_LEVELS if q['name'] == quality))
+    if parallax is not None:
+        settings['parallax'] = parallax
+    movement.apply_quality(settings)
+    renderer = DirtyRenderer() if mode == "dirty" else None
+    def op():
+        profiler.begin_frame()
+        movement.clouds.update()
+        movement.lava.update()
+        if bot:
+            edge_jump_bot(sim)
+        moving = sim.step()
+        if sim.won:
+            sim.new_level()
+        draw_game(screen, sim, skins, sim.camera_x, moving, 1.0, renderer)
+        if renderer is not None:
+            pygame.display.update(renderer.end())
+        else:
+            pygame.display.flip()
+        profiler.end_frame()
+    return op
+
+def setup_menu(mode):
+    """Кадр меню: облака плывут, остальное стоит"""
+    movement.clouds = CloudField(5, rng=np.random.default_rng(0))
+    renderer = DirtyRenderer() if mode == "dirty" else None
+    def op():
+        movement.clouds.update()
+        draw_ui("КООП ПЛАТФОРМЕР", "НАЧАТЬ ПРИКЛЮЧЕНИЕ", renderer)
+        if renderer is not None:
+            pygame.display.update(renderer.end())
+        else:
+            pygame.display.flip()
+    return op
+
+def setup_sprites(mode):
+    items = sprite_items(SKIN_P1, SCREEN_HEIGHT * CHAR_SCALE) + sprite_items(SKIN_P2, SCREEN_HEIGHT * CHAR_SCALE)
+    if mode == "decode":
+        # Старый путь: каждый Player сам декодировал, масштабировал и отражал кадры
+        return lambda: [pygame.transform.flip(load_and_scale(path, h), True, False) for path, h in items]
+    AssetManager().preload(items)  # прогреваем атлас на диске
+    return lambda: AssetManager().preload(items)
+
+def setup_startup(mode):
+    """Новый процесс: только импорт movement или запуск до первого кадра"""
+    if mode == "import":
+        cmd = [sys.executable, "-c", "import movement"]
+    else:
+        cmd = [sys.executable, "movement.py", "--first-frame"]
+    return lambda: subprocess.run(cmd, cwd=ROOT, check=True,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+for count in (15, 1000, 10000):
+    add_case(f"generate_level[platforms={count}]", setup_generate_level, count)
+for players in (2, 8, 32):
+    for count in (15, 100000):
+        add_case(f"sim_step[players={players},platforms={count}]", setup_sim_step, players, count)
+add_case("sim_step[players=2,platforms=15,swept]", setup_sim_step, 2, 15, True)
+for dt in (4, 8):
+    add_case(f"sim_step[players=2,platforms=15,dt={dt}]", setup_sim_step, 2, 15, True, dt)
+for players in (2, 8):
+    add_case(f"sim_step[players={players},endless]", setup_sim_endless, players)
+for players in (2, 8):
+    add_case(f"key_dispatch[players={players}]", setup_key_dispatch, players)
+for players in (2, 8):
+    add_case(f"trace_record[players={players}]", setup_trace_record, players)
+add_case("trace_seek[ticks=100000]", setup_trace_seek, 100000)
+for count in (15, 100000):
+    add_case(f"sim_step[players=2,platforms={count},file]", setup_sim_step_file, 2, count)
+for count in (1000, 1000000):
+    add_case(f"level_open[platforms={count}]", setup_level_open, count)
+for mode in ("save", "restore"):
+    for players in (2, 32):
+        add_case(f"snapshot[{mode},players={players}]", setup_snapshot, mode, players)
+for worlds in (1, 1024, 16384):
+    add_case(f"batch_step[worlds={worlds}]", setup_batch_step, worlds)
+for count in (15, 100000):
+    add_case(f"draw_platforms[platforms={count}]", setup_draw_platforms, count)
+add_case("draw_platforms_per_brick[platforms=15]", setup_draw_platforms_per_brick, 15)
+for capacity in (20, 1000, 10000):
+    add_case(f"draw_lava[particles={capacity}]", setup_lava, capacity)
+for count in (5, 50):
+    add_case(f"clouds[clouds={count}]", setup_clouds, count)
+for players in (2, 8):
+    for count in (15, 100000):
+        add_case(f"full_frame[players={players},platforms={count}]", setup_full_frame, players, count, frame=True)
+for mode in ("flip", "dirty"):
+    for parallax in (True, False):
+        add_case(f"full_frame[players=2,scrolling,parallax={'on' if parallax else 'off'},{mode}]",
+                 setup_full_frame, 2, 15, mode, True, "high", parallax, frame=True)
+    add_case(f"full_frame[players=2,idle,{mode}]", setup_full_frame, 2, 15, mode, False, frame=True)
+    add_case(f"menu_frame[{mode}]", setup_menu, mode)
+for q in QUALITY_LEVELS[1:]:
+    add_case(f"full_frame[players=2,quality={q['name']}]", setup_full_frame, 2, 15, "flip", True, q['name'], frame=True)
+add_case("sprites_load[decode]", setup_sprites, "decode")
+add_case("sprites_load[atlas]", setup_sprites, "atlas")
+add_case("startup[import]", setup_startup, "import")
+add_case("startup[first_frame]", setup_startup, "first_frame")
+
+# --- ЗАПУСК ---
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get('cases', {})
+    except (OSError, ValueError):
+        return {}
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({'python': platform.python_version(), 'pygame': pygame.version.ver,
+                   'numpy': np.__version__, 'cases': results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def run(pattern=None, threshold=DEFAULT_THRESHOLD, update_baseline=False):
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+    print(f"{'case':<52}{'ns/op':>14}{'ops/s':>12}{'baseline':>10}")
+    for name, setup, args, frame in CASES:
+        if pattern and pattern not in name:
+            continue
+        random.seed(0)
+        ns = measure(setup(*args))
+        results[name] = round(ns, 1)
+        rate = 1e9 / ns
+        rate_str = f"{rate:.0f} fps" if frame else f"{rate:.0f}"
+        ref = baseline.get(name)
+        if ref:
+            ratio = ns / ref
+            status = f"x{ratio:.2f}"
+            if ratio > threshold:
+                status += " REGRESSION"
+                regressions.append(name)
+        else:
+            status = "-"
+        print(f"{name:<52}{ns:>14,.0f}{rate_str:>12}{status:>10}")
+
+    if update_baseline:
+        baseline.update(results)
+        save_baseline(baseline)
+        print(f"baseline updated: {BASELINE_PATH}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regression(s) over x{threshold}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    pattern = args[args.index("-k") + 1] if "-k" in args else None
+    threshold = float(args[args.index("--threshold") + 1]) if "--threshold" in args else DEFAULT_THRESHOLD
+    code = run(pattern, threshold, "--update-baseline" in args)
+    pygame.quit()
+    sys.exit(code)
@@ -0,0 +1,419 @@
+"""Траектории игроков по тикам: призраки для спидрана и разбор забегов.
+
+На тик и игрока пишутся rect.x, rect.y, vel_y (с точностью 0.1), на земле
+ли, куда смотрит и кадр анимации. Каждое поле - разность с предсказанием
+(dx - как на прошлом тике, vel_y - гравитация или 0 на земле, dy - по
+скорости), упакованная в биты: совпало с предсказанием - 1 бит, малая
+поправка - 2 + k бит, прыжок или приземление - 3 + MID_BITS, респаун -
+3 + 32. Выходит около байта на игрока на тик (с ключевыми кадрами)
+вместо десятков байт на объект.
+
+Файл - заголовок и блоки до BLOCK_TICKS тиков. Блок начинается с ключевого
+кадра (полное состояние игроков) и читается без предыдущих; новый уровень
+(в том числе респаун) всегда открывает новый блок. Блоки дописываются в
+файл по мере заполнения, поэтому запись переживает падение игры. При
+открытии файл отображается в память (mmap), индекс строится по заголовкам
+блоков: переход на любой тик декодирует не больше одного блока.
+
+    python movement.py --trace run.trc [--seed 42]   # записать траектории
+    python movement.py --ghost run.trc --seed 42     # бежать против призраков
+    python ghost.py info run.trc
+    python ghost.py bench [тиков]
+"""
+import os
+import sys
+import mmap
+import time
+import random
+import struct
+from bisect import bisect_right
+
+from simulation import TICK_RATE, GRAVITY, MAX_FALL_SPEED, Simulation, edge_jump_bot
+
+MAGIC = b"BGTR"
+VERSION = 1
+BLOCK_TICKS = 64
+# magic, версия, игроков, тиков/с, тиков в полном блоке
+HEADER = struct.Struct("<4sBBHH")
+# первый тик, номер уровня, seed уровня, флаги, тиков, байт битового потока
+BLOCK = struct.Struct("<IIIBHI")
+KEY = struct.Struct("<iihB")   # ключевой кадр игрока: x, y, vel_y * 10, флаги
+
+BLOCK_RUN_START = 1   # блок открывает забег (новый уровень)
+BLOCK_SEEDED = 2      # seed уровня настоящий
+BLOCK_WON = 4         # забег кончился победой (ставится на последний блок забега)
+
+# Флаги состояния: бит 0 - на земле, 1 - смотрит вправо, 2-3 - поза, 4-6 - кадр бега
+POSE_IDLE, POSE_RUN, POSE_JUMP, POSE_FALL = range(4)
+POSE_NAMES = ('idle', 'run', 'jump', 'fall')   # для отрисовки: наборы кадров PlayerSprites
+VEL_SCALE = 10
+GRAVITY_Q = round(GRAVITY * VEL_SCALE)
+MAX_FALL_Q = round(MAX_FALL_SPEED * VEL_SCALE)
+# Бит на малую поправку: vel_y, dx, dy
+K_VEL = 4
+K_DX = 4
+K_DY = 3
+MID_BITS = 9
+
+def player_state(p):
+    """Состояние игрока для записи: (x, y, vel_y * 10, флаги)"""
+    if not p.on_ground:
+        pose = POSE_JUMP if p.vel_y < -2 else POSE_FALL
+    else:
+        pose = POSE_RUN if p.was_moving else POSE_IDLE
+    flags = p.on_ground | p.look_right << 1 | pose << 2 | (p.anim_timer >> 3 & 7) << 4
+    return p.rect.x, p.rect.y, round(p.vel_y * VEL_SCALE), flags
+
+def state_pose(flags):
+    """(на земле, смотрит вправо, поза, кадр бега) из флагов состояния"""
+    return bool(flags & 1), bool(flags & 2), flags >> 2 & 3, flags >> 4
+
+# --- БИТОВЫЙ ПОТОК ---
+class BitWriter:
+    """Биты младшими вперед в одно большое целое; блок маленький, так быстрее списка байт"""
+    def __init__(self):
+        self.acc = 0
+        self.bits = 0
+
+    def write(self, value, bits):
+        self.acc |= value << self.bits
+        self.bits += bits
+
+    def put(self, value, k):
+        """Поправка к предсказанию: 0 - бит 0; малая - 01 и k бит;
+        средняя (приземление, прыжок) - 011 и MID_BITS бит; иначе 111 и 32 бита"""
+        if value == 0:
+            self.write(0, 1)
+            return
+        u = (value << 1 if value > 0 else -(value << 1) - 1) - 1
+        if u < 1 << k:
+            self.write(0b01 | u << 2, k + 2)
+        elif u < 1 << MID_BITS:
+            self.write(0b011 | u << 3, MID_BITS + 3)
+        else:
+            self.write(0b111 | (value & 0xFFFFFFFF) << 3, 35)
+
+    def getvalue(self):
+        return self.acc.to_bytes((self.bits + 7) // 8, "little")
+
+class BitReader:
+    def __init__(self, data):
+        self.acc = int.from_bytes(data, "little")
+        self.pos = 0
+
+    def read(self, bits):
+        value = self.acc >> self.pos & ((1 << bits) - 1)
+        self.pos += bits
+        return value
+
+    def get(self, k):
+        if not self.read(1):
+            return 0
+        if not self.read(1):
+            u = self.read(k) + 1
+        elif not self.read(1):
+            u = self.read(MID_BITS) + 1
+        else:
+            value = self.read(32)
+            return value - (1 << 32) if value & 0x80000000 else value
+        return u >> 1 if u & 1 == 0 else -(u >> 1) - 1
+
+def predict_vel(vel_q, flags):
+    return 0 if flags & 1 else min(vel_q + GRAVITY_Q, MAX_FALL_Q)
+
+def predict_dy(vel_q):
+    # rect.y += vel_y с округлением
+    return (vel_q + VEL_SCALE // 2) // VEL_SCALE
+
+# --- ЗАПИСЬ ---
+class TraceRecorder:
+    """Пишет траектории игроков в файл блоками; record(sim) - после каждого тика (dt=1)"""
+    def __init__(self, path, sim, block_ticks=BLOCK_TICKS):
+        self.path = path
+        self.players = len(sim.players)
+        self.block_ticks = block_ticks
+        self.f = open(path, "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION, self.players, TICK_RATE, block_ticks))
+        self.level_index = None
+        self.block = None       # (первый тик, уровень, seed, флаги, ключевой кадр)
+        self.ticks = 0          # тиков в текущем блоке
+        self.writer = None
+        self.prev = None        # [(x, y, vel_q, флаги, dx)] прошлого тика
+        self.won = False
+        self.total_ticks = 0
+        self.bytes = HEADER.size
+
+    def record(self, sim):
+        states = [player_state(p) for p in sim.players]
+        self.total_ticks += 1
+        new_run = sim.level_index != self.level_index
+        if new_run or self.ticks >= self.block_ticks:
+            self.flush(won=new_run and self.won)
+            level = sim.level
+            flags = (BLOCK_RUN_START if new_run else 0) | (BLOCK_SEEDED if level.seed is not None else 0)
+            self.block = (sim.tick, sim.level_index, level.seed or 0, flags, states)
+            self.level_index = sim.level_index
+            self.ticks = 1
+            self.writer = BitWriter()
+            self.prev = [s + (0,) for s in states]
+            self.won = sim.won
+            return
+
+        w = self.writer
+        prev = self.prev
+        for i, (x, y, vel_q, flags) in enumerate(states):
+            px, py, pvel, pflags, pdx = prev[i]
+            if flags == pflags:
+                w.write(0, 1)
+            else:
+                w.write(1 | flags << 1, 8)
+            w.put(vel_q - predict_vel(pvel, flags), K_VEL)
+            dx = x - px
+            w.put(dx - pdx, K_DX)
+            w.put(y - py - predict_dy(vel_q), K_DY)
+            prev[i] = (x, y, vel_q, flags, dx)
+        self.ticks += 1
+        self.won = sim.won
+
+    def flush(self, won=False):
+        """Дописывает текущий блок в файл (won - им кончился выигранный забег)"""
+        if self.block is None:
+            return
+        first_tick, level_index, seed, flags, key = self.block
+        payload = self.writer.getvalue()
+        data = bytearray(BLOCK.pack(first_tick, level_index, seed, flags | (BLOCK_WON if won else 0),
+                                    self.ticks, len(payload)))
+        for x, y, vel_q, pflags in key:
+            data += KEY.pack(x, y, vel_q, pflags)
+        data += payload
+        self.f.write(data)
+        self.f.flush()
+        self.bytes += len(data)
+        self.block = None
+
+    def close(self):
+        self.flush(won=self.won)
+        self.f.close()
+
+# --- ЧТЕНИЕ ---
+class TraceFile:
+    """Файл траекторий через mmap: индекс блоков и забегов, декодирование по блоку"""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            try:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path}: пустой файл") from None
+        if len(self.mm) < HEADER.size:
+            raise ValueError(f"{path}: не файл траекторий")
+        magic, version, self.players, self.tick_rate, self.block_ticks = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не файл траекторий или другая версия формата")
+
+        # Индекс по заголовкам блоков; недописанный хвост (игра упала) отбрасывается
+        self.offsets = []
+        self.first_ticks = []
+        self.block_info = []   # (уровень, seed, флаги, тиков)
+        self.runs = []         # [номер первого блока, seed или None, тиков, выигран]
+        offset = HEADER.size
+        key_size = KEY.size * self.players
+        while offset + BLOCK.size <= len(self.mm):
+            first_tick, level_index, seed, flags, ticks, size = BLOCK.unpack_from(self.mm, offset)
+            if offset + BLOCK.size + key_size + size > len(self.mm):
+                break
+            if flags & BLOCK_RUN_START or not self.runs:
+                self.runs.append([len(self.offsets), seed if flags & BLOCK_SEEDED else None, 0, False])
+            run = self.runs[-1]
+            run[2] += ticks
+            run[3] = bool(flags & BLOCK_WON)
+            self.offsets.append(offset)
+            self.first_ticks.append(first_tick)
+            self.block_info.append((level_index, seed, flags, ticks))
+            offset += BLOCK.size + key_size + size
+        self.size = offset
+        self.cache = {}
+
+    @property
+    def ticks(self):
+        return sum(info[3] for info in self.block_info)
+
+    def decode_block(self, b):
+        """Состояния всех тиков блока: [[(x, y, vel_q, флаги)] по игрокам]"""
+        states = self.cache.get(b)
+        if states is not None:
+            return states
+        offset = self.offsets[b]
+        ticks, size = BLOCK.unpack_from(self.mm, offset)[4:]
+        offset += BLOCK.size
+        prev = []
+        for _ in range(self.players):
+            prev.append(KEY.unpack_from(self.mm, offset) + (0,))
+            offset += KEY.size
+        states = [[s[:4] for s in prev]]
+        r = BitReader(self.mm[offset:offset + size])
+        for _ in range(ticks - 1):
+            tick = []
+            for i in range(self.players):
+                px, py, pvel, pflags, pdx = prev[i]
+                flags = r.read(7) if r.read(1) else pflags
+                vel_q = predict_vel(pvel, flags) + r.get(K_VEL)
+                dx = pdx + r.get(K_DX)
+                y = py + predict_dy(vel_q) + r.get(K_DY)
+                prev[i] = (px + dx, y, vel_q, flags, dx)
+                tick.append((px + dx, y, vel_q, flags))
+            states.append(tick)
+        # Держим пару последних блоков: курсор и переход через границу блока
+        if len(self.cache) >= 2:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[b] = states
+        return states
+
+    def state_at(self, tick):
+        """Состояние игроков на тике партии (sim.tick после шага) или None"""
+        b = bisect_right(self.first_ticks, tick) - 1
+        if b < 0 or tick - self.first_ticks[b] >= self.block_info[b][3]:
+            return None
+        return self.decode_block(b)[tick - self.first_ticks[b]]
+
+    def find_run(self, seed):
+        """Забег по уровню с этим seed: самый быстрый выигранный, иначе последний"""
+        runs = [r for r in self.runs if r[1] == seed]
+        won = [r for r in runs if r[3]]
+        if won:
+            return self.runs.index(min(won, key=lambda r: r[2]))
+        return self.runs.index(runs[-1]) if runs else None
+
+    def cursor(self, run):
+        return TraceCursor(self, run)
+
+    def close(self):
+        self.cache.clear()
+        self.mm.close()
+
+class TraceCursor:
+    """Проигрывание одного забега тик за тиком; seek - переход на тик забега"""
+    def __init__(self, trace, run):
+        self.trace = trace
+        first, _, self.ticks, _ = trace.runs[run]
+        self.first_block = first
+        self.block_starts = []   # тик забега, с которого начинается блок
+        t = 0
+        b = first
+        while t < self.ticks:
+            self.block_starts.append(t)
+            t += trace.block_info[b][3]
+            b += 1
+        self.seek(0)
+
+    def seek(self, tick):
+        self.tick = max(0, min(tick, self.ticks - 1))
+        i = bisect_right(self.block_starts, self.tick) - 1
+        self.block = self.first_block + i
+        self.index = self.tick - self.block_starts[i]
+        self.states = self.trace.decode_block(self.block)
+        self.prev = self.state
+        return self.state
+
+    @property
+    def state(self):
+        return self.states[self.index]
+
+    @property
+    def done(self):
+        return self.tick >= self.ticks - 1
+
+    def advance(self):
+        """Следующий тик забега; на последнем призрак стоит на месте"""
+        self.prev = self.state
+        if self.done:
+            return self.state
+        self.tick += 1
+        self.index += 1
+        if self.index >= len(self.states):
+            self.block += 1
+            self.index = 0
+            self.states = self.trace.decode_block(self.block)
+        return self.state
+
+class GhostPlayback:
+    """Призраки в игре: на каждом уровне - забег из файла по уровню с тем же seed.
+
+    follow(sim) зовется после каждого тика партии (как TraceRecorder.record),
+    поэтому тик призрака совпадает с тиком записанного забега.
+    """
+    def __init__(self, trace):
+        self.trace = trace
+        self.cursor = None
+        self.level_index = None
+
+    def follow(self, sim):
+        if sim.level_index != self.level_index:
+            self.level_index = sim.level_index
+            run = self.trace.find_run(sim.level.seed)
+            self.cursor = self.trace.cursor(run) if run is not None else None
+        elif self.cursor is not None:
+            self.cursor.advance()
+
+    def states(self, alpha):
+        """[(x, y, поза, смотрит вправо, кадр бега)] призраков между прошлым и текущим тиком"""
+        if self.cursor is None:
+            return []
+        states = []
+        for (px, py, _, _), (x, y, _, flags) in zip(self.cursor.prev, self.cursor.state):
+            _, look_right, pose, frame = state_pose(flags)
+            states.append((px + (x - px) * alpha, py + (y - py) * alpha, POSE_NAMES[pose], look_right, frame))
+        return states
+
+    def describe(self):
+        c = self.cursor
+        if c is None:
+            return "Ghost: no recorded run for this level"
+        return f"Ghost: tick {c.tick}/{c.ticks}{' (finished)' if c.done else ''}"
+
+def bench(ticks):
+    """Запись бота на ticks тиков во временный файл, затем чтение и переходы"""
+    path = "bench_trace.trc"
+    sim = Simulation(rng=random.Random(0))
+    recorder = TraceRecorder(path, sim)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        edge_jump_bot(sim)
+        sim.step()
+        recorder.record(sim)
+        if sim.won:
+            sim.new_level()
+    recorder.close()
+    record_s = time.perf_counter() - start
+
+    trace = TraceFile(path)
+    rng = random.Random(1)
+    first, last = trace.first_ticks[0], trace.first_ticks[-1]
+    start = time.perf_counter()
+    for _ in range(1000):
+        trace.cache.clear()
+        trace.state_at(rng.randrange(first, last))
+    seek_s = (time.perf_counter() - start) / 1000
+    size = os.path.getsize(path)
+    per = (size - HEADER.size) / ticks / trace.players
+    print(f"{ticks} ticks x {trace.players} players: {size / 1024:.1f} KB, {per:.2f} bytes/player/tick, "
+          f"{len(trace.runs)} runs, {len(trace.offsets)} blocks")
+    print(f"record {record_s / ticks * 1e6:.1f} us/tick (with sim), random seek {seek_s * 1e6:.0f} us")
+    trace.close()
+    os.remove(path)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] not in ("info", "bench"):
+        print(__doc__)
+        sys.exit(2)
+    if args[0] == "bench":
+        bench(int(args[1]) if len(args) > 1 else 100000)
+    else:
+        trace = TraceFile(args[1])
+        ticks = trace.ticks
+        print(f"{args[1]}: {trace.players} players, {ticks} ticks ({ticks / trace.tick_rate:.1f} s), "
+              f"{len(trace.offsets)} blocks, {len(trace.runs)} runs, "
+              f"{(trace.size - HEADER.size) / max(1, ticks) / trace.players:.2f} bytes/player/tick")
+        for first, seed, run_ticks, won in trace.runs:
+            level_index = trace.block_info[first][0]
+            print(f"  level {level_index}: seed {seed}, {run_ticks} ticks{' WON' if won else ''}")
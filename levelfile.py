@@ -0,0 +1,154 @@
+"""Файлы уровней: заголовок и упакованный массив int32 прямоугольников платформ.
+
+Формат (little-endian): HEADER, затем rect_count раз (x, y, w, h) int32,
+отсортированные по левому краю, затем spawn_count раз (x, низ) int32 -
+точки спауна игроков. load_level отображает файл в память (mmap), и индекс
+коллизий (PackedPlatformIndex) читает платформы прямо из отображения: уровень
+на миллион платформ открывается за миллисекунды, pygame.Rect создаются
+только для платформ рядом с игроками и камерой.
+
+Уровень, сохраненный из generate_level, помнит seed и platform_count, и
+записи сессий и снимки строят его заново как обычно. У нарисованного вручную
+уровня seed нет, поэтому записывать игру на нем нельзя (как и без --seed).
+
+    python levelfile.py save FILE [--seed N] [--platforms N]   # сгенерировать и записать
+    python levelfile.py info FILE
+    python levelfile.py bench [N]                             # запись и открытие N платформ
+    python movement.py --level FILE                           # играть уровень из файла
+"""
+import os
+import sys
+import time
+import mmap
+import zlib
+import struct
+from array import array
+
+import pygame
+
+from simulation import Level, PackedPlatformIndex, PlatformIndex, generate_level
+
+MAGIC = b"BGLV"
+VERSION = 1
+FLAG_SEEDED = 1   # seed и platform_count настоящие: уровень можно сгенерировать заново
+# magic, версия, флаги, платформ, макс. ширина, end_x, выход (x, y, w, h; w = 0 - нет),
+# spawn_y, точек спауна, seed, platform_count, CRC данных
+HEADER = struct.Struct("<4sHHIIi4iiIIII")
+RECT = 4   # int32 на платформу
+
+def save_level(level, path):
+    """Пишет уровень в файл; платформы берутся из индекса уже по порядку"""
+    rects = array('i')
+    max_width = 0
+    for r in level.platforms:
+        rects.extend((r.x, r.y, r.width, r.height))
+        max_width = max(max_width, r.width)
+    spawns = array('i')
+    for x, y in level.spawn_points or ():
+        spawns.extend((x, y))
+    if sys.byteorder != "little":
+        rects.byteswap()
+        spawns.byteswap()
+    payload = rects.tobytes() + spawns.tobytes()
+
+    ez = level.exit_zone
+    exit_rect = (ez.x, ez.y, ez.width, ez.height) if ez is not None else (0, 0, 0, 0)
+    seeded = level.seed is not None and level.platform_count is not None
+    header = HEADER.pack(MAGIC, VERSION, FLAG_SEEDED if seeded else 0, len(rects) // RECT, max_width,
+                         int(level.end_x), *exit_rect, level.spawn_y, len(spawns) // 2,
+                         level.seed or 0, level.platform_count or 0, zlib.crc32(payload))
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(payload)
+
+def load_level(path, check=False):
+    """Открывает уровень через mmap без копирования платформ.
+
+    check=True дополнительно сверяет CRC (читает весь файл).
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f"{path}: пустой файл") from None
+    if len(mm) < HEADER.size:
+        raise ValueError(f"{path}: не файл уровня")
+    (magic, version, flags, count, max_width, end_x, ex, ey, ew, eh,
+     spawn_y, spawn_count, seed, platform_count, crc) = HEADER.unpack_from(mm)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: не файл уровня или другая версия формата")
+    rects_end = HEADER.size + count * RECT * 4
+    end = rects_end + spawn_count * 2 * 4
+    if len(mm) != end:
+        raise ValueError(f"{path}: обрезанный файл уровня")
+    if check and zlib.crc32(memoryview(mm)[HEADER.size:]) != crc:
+        raise ValueError(f"{path}: данные уровня повреждены")
+
+    if sys.byteorder == "little":
+        data = memoryview(mm)[HEADER.size:rects_end].cast('i')
+    else:
+        # На big-endian без копии не обойтись
+        data = array('i', mm[HEADER.size:rects_end])
+        data.byteswap()
+        data = memoryview(data)
+    spawns = array('i', mm[rects_end:end])
+    if sys.byteorder != "little":
+        spawns.byteswap()
+    spawn_points = [(spawns[i], spawns[i + 1]) for i in range(0, len(spawns), 2)] or None
+
+    seeded = flags & FLAG_SEEDED
+    return Level(PackedPlatformIndex(data, max_width),
+                 pygame.Rect(ex, ey, ew, eh) if ew else None, end_x, spawn_y,
+                 seed if seeded else None, platform_count if seeded else None, spawn_points)
+
+class FileLevels:
+    """Источник уровней для Simulation: один уровень из файла на все попытки"""
+    def __init__(self, path):
+        self.level = load_level(path)
+
+    def take(self, index):
+        return self.level
+
+    def close(self):
+        pass
+
+def synthetic_level(count):
+    """Ровная дорожка из count платформ - для замера больших файлов без генерации"""
+    rects = [pygame.Rect(50 + i * 300, 420, 220, 40) for i in range(count)]
+    return Level(PlatformIndex(rects), None, rects[-1].right + 200, 420)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] not in ("save", "info", "bench"):
+        print(__doc__)
+        sys.exit(2)
+
+    if args[0] == "save":
+        seed = int(args[args.index("--seed") + 1]) if "--seed" in args else 0
+        count = int(args[args.index("--platforms") + 1]) if "--platforms" in args else 15
+        save_level(generate_level(count, seed=seed), args[1])
+        print(f"{args[1]}: {count + 2} platforms, seed {seed}, {os.path.getsize(args[1])} bytes")
+
+    elif args[0] == "info":
+        level = load_level(args[1], check=True)
+        print(f"{args[1]}: {len(level.platforms)} platforms, end_x {level.end_x}, exit {level.exit_zone}, "
+              f"spawn_y {level.spawn_y}, spawn points {level.spawn_points}, "
+              f"seed {level.seed}, platform_count {level.platform_count}")
+
+    else:
+        count = int(args[1]) if len(args) > 1 else 1_000_000
+        path = "bench_level.bin"
+        level = synthetic_level(count)
+        start = time.perf_counter()
+        save_level(level, path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        level = load_level(path)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        hits = sum(len(level.platforms.query(x, x + 1000)) for x in range(0, count * 300, count * 3))
+        queried = (time.perf_counter() - start) / 100
+        print(f"{count} platforms, {os.path.getsize(path) / 1e6:.1f} MB: save {saved * 1000:.0f} ms, "
+              f"open {opened * 1000:.2f} ms, query {queried * 1e6:.1f} us ({hits} hits in 100 queries)")
+        del level
+        os.remove(path)
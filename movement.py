@@ -1,17 +1,94 @@
+import time
+IMPORT_START = time.perf_counter()  # для замера импорта и времени до первого кадра
+
 import pygame
 import sys
+import math
 import random
+from collections import OrderedDict
 
-# Инициализация
-pygame.init()
-pygame.font.init()
+from simulation import (SCREEN_WIDTH, SCREEN_HEIGHT, GROUND_Y, CHAR_SCALE,
+                        PLAYER_SIZES, PLAYER_START_X, Player, PlayerRegistry, Simulation,
+                        FixedTimestep, LevelPrefetcher, EndlessLevels, edge_jump_bot)
+from particles import LavaParticles, CloudField
+from assets import assets
+from profiler import profiler
+from textcache import text_cache, get_font
+from quality import QualityGovernor, QUALITY_LEVELS, full_resolution_levels
+# Модули отдельных режимов (запись, сеть, уровень из файла, призраки)
+# импортируются там, где режим включается, а не при импорте игры
 
 # --- КОНСТАНТЫ И НАСТРОЙКИ ---
-SCREEN_WIDTH = 1000
-SCREEN_HEIGHT = 600
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.DOUBLEBUF | pygame.HWSURFACE)
-pygame.display.set_caption("Кооп Платформер: Исправленная версия")
-clock = pygame.time.Clock()
+# Размеры экрана и физика живут в simulation.py.
+# Окно, шрифты и спрайты создаются в startup(), а не при импорте
+screen = None
+clock = None
+FPS_LIMIT = 144  # Отрисовка не привязана к тикам логики (TICK_RATE)
+
+def option_error(message):
+    """Неверная опция командной строки: сообщение и выход до открытия окна"""
+    print(f"movement.py: {message}")
+    sys.exit(2)
+
+def cli_option(name):
+    """Значение опции командной строки вида `--name value` или None"""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+def int_option(name, default, low, high):
+    """Целое значение опции `--name N` в пределах [low, high]; нет опции - default"""
+    value = cli_option(name)
+    if value is None:
+        if name in sys.argv:
+            option_error(f"{name} expects a value")
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        option_error(f"{name} expects an integer, got {value!r}")
+    if not low <= value <= high:
+        option_error(f"{name} must be between {low} and {high}, got {value}")
+    return value
+
+# --seed N - воспроизводимая последовательность уровней, --record FILE - запись ввода,
+# --endless - бесконечный уровень без выхода,
+# --net PORT HOST:PORT --player 0|1 - кооп по сети (seed выбирает игрок 0);
+#   уровни в сети всегда генерируются по общему seed, поэтому --level и --endless с ней нельзя,
+# --dirty - вывод кадра грязными прямоугольниками (DirtyRenderer),
+# --quality high|medium|low|lowest - зафиксировать качество (иначе - по бюджету кадра);
+#   с --dirty кадр всегда в полном разрешении, и lowest отличается от low только пузырями лавы,
+# --level FILE - уровень из файла (levelfile.py) вместо генерации,
+# --players N --bots K - N игроков (от 2 до MAX_PLAYERS), последние K из них - боты
+#   (живых игроков не больше, чем раскладок в KEY_MAPS),
+# --trace FILE - записать траектории игроков (ghost.py), --ghost FILE - призраки из такой записи
+LEVEL_SEED = cli_option("--seed")
+if LEVEL_SEED is not None:
+    LEVEL_SEED = int(LEVEL_SEED)
+RECORD_PATH = cli_option("--record")
+NET_PORT = int_option("--net", None, 1, 65535)
+NET_PEER = None
+if NET_PORT is not None:
+    # Адрес пира - следующий аргумент после порта: HOST:PORT
+    i = sys.argv.index("--net") + 2
+    NET_PEER = sys.argv[i] if i < len(sys.argv) else ""
+    host, _, port = NET_PEER.rpartition(":")
+    if not host or not port.isdigit() or not 1 <= int(port) <= 65535:
+        option_error(f"--net expects PORT HOST:PORT, got peer {NET_PEER!r}")
+    NET_PEER_ADDR = (host, int(port))
+NET_PLAYER = int_option("--player", 0, 0, 1)
+DIRTY_RECTS = "--dirty" in sys.argv
+QUALITY = cli_option("--quality")
+QUALITY_NAMES = [q['name'] for q in QUALITY_LEVELS]
+if QUALITY is not None and QUALITY not in QUALITY_NAMES:
+    option_error(f"unknown --quality {QUALITY!r}, expected one of: {', '.join(QUALITY_NAMES)}")
+LEVEL_FILE = cli_option("--level")
+if NET_PORT is not None and (LEVEL_FILE is not None or "--endless" in sys.argv):
+    option_error("--level and --endless do not work with --net: both peers play levels generated from a shared seed")
+TRACE_PATH = cli_option("--trace")
+GHOST_PATH = cli_option("--ghost")
+MAX_PLAYERS = 8
+PLAYER_COUNT = int_option("--players", 2, 2, MAX_PLAYERS)
 
 # Состояния
 STATE_MENU = "menu"
@@ -19,13 +96,6 @@ STATE_PLAYING = "playing"
 STATE_WIN = "win"
 current_state = STATE_MENU
 
-# Физика
-GRAVITY = 0.8
-JUMP_FORCE = -16  # Немного меньше для проходимости
-MOVE_SPEED = 6
-CHAR_SCALE = 0.18
-GROUND_Y = SCREEN_HEIGHT - 60
-
 # Коды клавиш для русской раскладки
 KEY_RU_W = 1094
 KEY_RU_A = 1092
@@ -46,36 +116,59 @@ IS_LINUX = platform.system() == 'Linux'
 # Цвета
 COLOR_SKY_TOP = (100, 160, 240)
 COLOR_SKY_BOTTOM = (200, 230, 255)
+COLOR_PARALLAX_KEY = (255, 0, 255)  # прозрачный фон полос параллакса
 COLOR_LAVA_BG = (220, 50, 20)
-COLOR_LAVA_BUBBLE = (255, 200, 80)
 COLOR_BRICK_MAIN = (166, 76, 58)
 COLOR_BRICK_MORTAR = (80, 30, 20)
 
-# Шрифты
-font_title = pygame.font.SysFont("Arial", 80, bold=True)
-font_btn = pygame.font.SysFont("Arial", 40, bold=True)
-font_debug = pygame.font.SysFont("Arial", 16, bold=False)  # Для отладки
+# Шрифты: (имена, размер, жирный); загружаются при первом использовании
+FONT_TITLE = ("Arial", 80, True)
+FONT_BTN = ("Arial", 40, True)
+FONT_DEBUG = ("Arial", 16, False)  # Для отладки
+FONT_MONO = ("Courier New,DejaVu Sans Mono,monospace", 14, False)  # Таблица профайлера
 
 # Переменная для отладки
 show_debug = False
+PLAYER_COLORS = [(100, 200, 255), (255, 100, 200)]  # строки игроков в оверлее
 
 # Кэш
 sky_cache = None
 lava_cache = None
 
-# --- ХЕЛПЕРЫ ---
-def load_and_scale(path, target_h):
-    try:
-        img = pygame.image.load(path).convert_alpha()
-        scale = target_h / img.get_height()
-        new_w = int(img.get_width() * scale)
-        new_h = int(img.get_height() * scale)
-        return pygame.transform.smoothscale(img, (new_w, new_h))
-    except:
-        surf = pygame.Surface((40, 60))
-        surf.fill((255, 0, 255))
-        return surf
+# Кэш запечённых платформ: (ширина, высота, стиль) -> Surface, LRU
+PLATFORM_CACHE_SIZE = 64
+platform_cache = OrderedDict()
+
+# Стили кирпичной кладки: (ширина кирпича, высота кирпича, цвет кирпича, цвет шва);
+# у 'flat' кирпичей нет - сплошная заливка для низкого качества
+BRICK_STYLES = {
+    'bricks': (30, 15, COLOR_BRICK_MAIN, COLOR_BRICK_MORTAR),
+    'flat': (None, None, COLOR_BRICK_MAIN, COLOR_BRICK_MORTAR),
+}
+
+# Текущее качество (quality.py): стиль платформ и разрешение кадра;
+# лимит пузырей и детализацию облаков apply_quality ставит прямо в частицы
+platform_style = 'bricks'
+render_scale = 1.0
+parallax_enabled = True
+# Уменьшенные копии неба и лавы и кадр пониженного разрешения: (имя, масштаб) -> Surface
+scaled_layers = {}
 
+# Параллакс: слои фона между облаками и платформами, дальние - медленнее.
+# (имя, доля скорости камеры, средняя линия силуэта, цвет, волны (периодов на полосу, амплитуда)).
+# Число периодов целое, поэтому полоса ширины PARALLAX_TILE_WIDTH повторяется без шва
+PARALLAX_TILE_WIDTH = 1200
+PARALLAX_LAYERS = [
+    ('mountains', 0.1, 360, (160, 185, 225), ((2, 45), (5, 25), (11, 8))),
+    ('hills', 0.25, 440, (135, 185, 165), ((3, 25), (7, 12), (17, 4))),
+    ('bushes', 0.5, 500, (95, 150, 110), ((8, 10), (19, 6), (41, 3))),
+]
+# Полосы параллакса: (номер слоя, масштаб) -> (Surface, верх полосы в пикселях кадра)
+parallax_tiles = {}
+# Полосы неба, не закрытые слоями параллакса (sky_bands)
+sky_bands_cache = {}
+
+# --- ХЕЛПЕРЫ ---
 def is_action_active(keys, key_list):
     """Проверяет нажатие клавиш с поддержкой раскладок"""
     for k in key_list:
@@ -84,35 +177,9 @@ def is_action_active(keys, key_list):
     return False
 
 # --- ОКРУЖЕНИЕ ---
-class Cloud:
-    def __init__(self):
-        self.reset(random_x=True)
-        
-    def reset(self, random_x=False):
-        self.x = random.randint(0, SCREEN_WIDTH) if random_x else -200
-        self.y = random.randint(20, 200)
-        self.speed = random.uniform(0.2, 0.5)
-        self.parts = []
-        for _ in range(random.randint(4, 7)):
-            self.parts.append({
-                'dx': random.randint(0, 100),
-                'dy': random.randint(0, 30),
-                'r': random.randint(25, 45)
-            })
-            
-    def update(self):
-        self.x += self.speed
-        if self.x > SCREEN_WIDTH + 100:
-            self.reset(random_x=False)
-
-    def draw(self, surface):
-        for p in self.parts:
-            center = (int(self.x + p['dx']), int(self.y + p['dy']))
-            pygame.draw.circle(surface, (230, 240, 255), center, p['r'] + 2)
-            pygame.draw.circle(surface, (255, 255, 255), center, p['r'])
-
-clouds_list = [Cloud() for _ in range(5)]
-lava_particles = []
+# Облака и пузыри лавы - массивы NumPy (particles.py); создает startup()
+clouds = None
+lava = None
 
 def create_sky_cache():
     global sky_cache
@@ -127,309 +194,634 @@ def create_lava_cache():
     lava_cache = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT - GROUND_Y))
     lava_cache.fill(COLOR_LAVA_BG)
 
-def draw_world(surface, cam_x):
+def parallax_line(layer):
+    """Силуэт слоя: высота в каждой 4-й точке полосы (фаза волн постоянна для имени слоя)"""
+    name, _, base_y, _, waves = layer
+    rng = random.Random(name)
+    waves = [(k, amp, rng.uniform(0, 2 * math.pi)) for k, amp in waves]
+    return [base_y + sum(amp * math.sin(k * x / PARALLAX_TILE_WIDTH * 2 * math.pi + phase)
+                         for k, amp, phase in waves)
+            for x in range(0, PARALLAX_TILE_WIDTH + 1, 4)]
+
+def parallax_tile(i, scale=1.0):
+    """Полоса слоя параллакса на colorkey (рисуется один раз на масштаб).
+
+    Снизу полоса обрезана там, где ее целиком закрывают ближние слои.
+    """
+    tile = parallax_tiles.get((i, scale))
+    if tile is not None:
+        return tile
+    line = parallax_line(PARALLAX_LAYERS[i])
+    top = int(min(line))
+    bottom = min([int(max(parallax_line(near))) + 1 for near in PARALLAX_LAYERS[i + 1:]] + [GROUND_Y])
+    width = int(PARALLAX_TILE_WIDTH * scale)
+    height = int(bottom * scale) - int(top * scale)
+    img = pygame.Surface((width, height))
+    if pygame.display.get_surface() is not None:
+        img = img.convert()
+    img.fill(COLOR_PARALLAX_KEY)
+    img.set_colorkey(COLOR_PARALLAX_KEY, pygame.RLEACCEL)
+    points = [(0, height)] + [(int(j * 4 * scale), int((y - top) * scale)) for j, y in enumerate(line)]
+    pygame.draw.polygon(img, PARALLAX_LAYERS[i][3], points + [(width, height)])
+    tile = parallax_tiles[(i, scale)] = (img, int(top * scale))
+    return tile
+
+def sky_bands(scale=1.0):
+    """Полосы неба, которые видно из-под слоев параллакса: [Rect] в пикселях кадра.
+
+    Каждый слой сплошной от нижней точки силуэта до верха обрезки, а ниже
+    его продолжают ближние слои, поэтому от самой высокой из нижних точек
+    до GROUND_Y небо закрыто целиком; под GROUND_Y - лава (в меню ее нет).
+    """
+    if not parallax_enabled:
+        return [pygame.Rect(0, 0, int(SCREEN_WIDTH * scale), int(SCREEN_HEIGHT * scale))]
+    bands = sky_bands_cache.get(scale)
+    if bands is None:
+        cover_y = min(int(max(parallax_line(layer))) for layer in PARALLAX_LAYERS) + 1
+        width = int(SCREEN_WIDTH * scale)
+        bands = sky_bands_cache[scale] = [
+            pygame.Rect(0, 0, width, int(cover_y * scale)),
+            pygame.Rect(0, int(GROUND_Y * scale), width, int(SCREEN_HEIGHT * scale) - int(GROUND_Y * scale))]
+    return bands
+
+def parallax_rows(i):
+    """Строки экрана (верх, низ), которые занимает полоса слоя параллакса"""
+    img, top = parallax_tile(i)
+    return top, top + img.get_height()
+
+def draw_parallax(surface, cam_x, scale=1.0):
+    """Слои параллакса: каждая полоса повторяется по ширине и едет со своей скоростью.
+
+    Полосы вне clip поверхности пропускаются: обрезанный blit RLE-полосы
+    все равно проходит ее строки сверху.
+    """
+    clip = surface.get_clip()
+    blits = []
+    for i, layer in enumerate(PARALLAX_LAYERS):
+        img, top = parallax_tile(i, scale)
+        if top >= clip.bottom or top + img.get_height() <= clip.top:
+            continue
+        tile_w = img.get_width()
+        x = -(int(cam_x * layer[1] * scale) % tile_w)
+        while x < clip.right:
+            if x + tile_w > clip.left:
+                blits.append((img, (x, top)))
+            x += tile_w
+    surface.blits(blits, False)
+
+def scaled_layer(name, surf, scale):
+    """Копия слоя для кадра пониженного разрешения (один раз на масштаб)"""
+    if scale == 1.0:
+        return surf
+    img = scaled_layers.get((name, scale))
+    if img is None:
+        size = (int(surf.get_width() * scale), int(surf.get_height() * scale))
+        img = scaled_layers[(name, scale)] = pygame.transform.smoothscale(surf, size)
+    return img
+
+def frame_surface(scale):
+    """Поверхность кадра пониженного разрешения"""
+    surf = scaled_layers.get(("frame", scale))
+    if surf is None:
+        surf = pygame.Surface((int(SCREEN_WIDTH * scale), int(SCREEN_HEIGHT * scale)))
+        if pygame.display.get_surface() is not None:
+            surf = surf.convert()
+        scaled_layers[("frame", scale)] = surf
+    return surf
+
+def draw_world(surface, cam_x, scale=1.0):
     if sky_cache:
-        surface.blit(sky_cache, (0, 0))
-    for c in clouds_list: 
-        c.draw(surface)
+        sky = scaled_layer("sky", sky_cache, scale)
+        for band in sky_bands(scale):
+            surface.blit(sky, band, band)
+    clouds.draw(surface, scale=scale)
+    if parallax_enabled:
+        draw_parallax(surface, cam_x, scale)
 
-def draw_platforms(surface, platforms, cam_x):
-    brick_w, brick_h = 30, 15
+def bake_platform(width, height, style='bricks'):
+    """Рисует кирпичный узор платформы на отдельной поверхности (один раз)"""
+    brick_w, brick_h, color_main, color_mortar = BRICK_STYLES[style]
+    surf = pygame.Surface((width, height))
+    surf.fill(color_mortar)
     
-    for p in platforms:
-        if p.right < cam_x - 100 or p.left > cam_x + SCREEN_WIDTH + 100:
-            continue
-            
-        rect_draw = pygame.Rect(p.x - int(cam_x), p.y, p.width, p.height)
-        pygame.draw.rect(surface, COLOR_BRICK_MORTAR, rect_draw)
+    # Кирпичи рисуются относительно ПЛАТФОРМЫ, не камеры
+    platform_bounds = surf.get_rect()
+    if brick_w is None:
+        # Без кирпичей: заливка в рамке шва
+        surf.fill(color_main, platform_bounds.inflate(-4, -4))
+    rows = (height // brick_h) + 1 if brick_w is not None else 0
+    for row in range(rows):
+        y_pos = row * brick_h
+        x_shift = (brick_w // 2) if row % 2 else 0
         
-        # ИСПРАВЛЕНИЕ: Кирпичи рисуются относительно ПЛАТФОРМЫ, не камеры
-        rows = (p.height // brick_h) + 1
-        for row in range(rows):
-            y_pos = row * brick_h
-            x_shift = (brick_w // 2) if row % 2 else 0
-            
-            cols = (p.width + x_shift) // brick_w + 1
-            for col in range(cols):
-                brick_x = col * brick_w - x_shift
-                brick_y = y_pos
-                
-                # Создаем кирпич ОТНОСИТЕЛЬНО платформы
-                brick_rect = pygame.Rect(brick_x + 2, brick_y + 2, brick_w - 4, brick_h - 4)
-                
-                # Обрезаем по границам платформы (локальные координаты)
-                platform_bounds = pygame.Rect(0, 0, p.width, p.height)
-                clipped = brick_rect.clip(platform_bounds)
-                
-                if clipped.width > 0 and clipped.height > 0:
-                    # Переводим в экранные координаты
-                    screen_x = p.x + clipped.x - int(cam_x)
-                    screen_y = p.y + clipped.y
-                    screen_rect = pygame.Rect(screen_x, screen_y, clipped.width, clipped.height)
-                    pygame.draw.rect(surface, COLOR_BRICK_MAIN, screen_rect)
-
-def draw_lava(surface, cam_x):
+        cols = (width + x_shift) // brick_w + 1
+        for col in range(cols):
+            brick_rect = pygame.Rect(col * brick_w - x_shift + 2, y_pos + 2, brick_w - 4, brick_h - 4)
+            clipped = brick_rect.clip(platform_bounds)
+            if clipped.width > 0 and clipped.height > 0:
+                surf.fill(color_main, clipped)
+    
+    # Приводим к формату экрана, чтобы blit был быстрым
+    if pygame.display.get_surface() is not None:
+        surf = surf.convert()
+    return surf
+
+def get_platform_surface(width, height, style='bricks'):
+    """Возвращает запечённую поверхность платформы из LRU-кэша"""
+    key = (width, height, style)
+    surf = platform_cache.get(key)
+    if surf is not None:
+        platform_cache.move_to_end(key)
+        return surf
+    
+    surf = bake_platform(width, height, style)
+    platform_cache[key] = surf
+    if len(platform_cache) > PLATFORM_CACHE_SIZE:
+        platform_cache.popitem(last=False)
+    return surf
+
+def draw_platforms(surface, platforms, cam_x, scale=1.0):
+    """Рисует платформы в полосе камеры; возвращает их прямоугольники на поверхности"""
+    cam = int(cam_x)
+    style = platform_style
+    blits = []
+    
+    # Берем из индекса только платформы в полосе камеры
+    for p in platforms.query(cam_x - 100, cam_x + SCREEN_WIDTH + 101):
+        if scale == 1.0:
+            blits.append((get_platform_surface(p.width, p.height, style), (p.x - cam, p.y)))
+        else:
+            # Края округляются по отдельности, чтобы соседние платформы не съезжали
+            x, y = int((p.x - cam) * scale), int(p.y * scale)
+            w, h = int((p.right - cam) * scale) - x, int(p.bottom * scale) - y
+            blits.append((get_platform_surface(w, h, style), (x, y)))
+    return surface.blits(blits)
+
+def draw_lava(surface, cam_x, scale=1.0):
     if lava_cache:
+        surface.blit(scaled_layer("lava", lava_cache, scale), (0, int(GROUND_Y * scale)))
+    lava.draw(surface, scale)
+
+# Рамка выхода по размеру: рисуется один раз, дальше blit. Blit одинаково
+# обрезается полосами DirtyRenderer, а скругленный draw.rect под clip - нет
+exit_sprites = {}
+
+def draw_exit(surface, exit_zone, cam_x, scale=1.0):
+    key = (exit_zone.size, scale)
+    img = exit_sprites.get(key)
+    if img is None:
+        size = (int(exit_zone.width * scale), int(exit_zone.height * scale))
+        img = exit_sprites[key] = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.rect(img, (255, 215, 0), img.get_rect(), max(1, round(4 * scale)),
+                         border_radius=round(10 * scale))
+    return surface.blit(img, (int((exit_zone.x - int(cam_x)) * scale), int(exit_zone.y * scale)))
+
+def apply_quality(settings):
+    """Ставит настройки уровня качества (quality.QUALITY_LEVELS)"""
+    global platform_style, render_scale, parallax_enabled
+    lava.set_capacity(settings['particles'])
+    clouds.detail = settings['cloud_detail']
+    platform_style = 'bricks' if settings['bricks'] else 'flat'
+    render_scale = settings['render_scale']
+    parallax_enabled = settings['parallax']
+
+# --- ГРЯЗНЫЕ ПРЯМОУГОЛЬНИКИ ---
+SCREEN_RECT = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+# Полоса пузырей лавы: они всплывают до GROUND_Y и выступают над ним на радиус
+LAVA_STRIP = pygame.Rect(0, GROUND_Y - 8, SCREEN_WIDTH, SCREEN_HEIGHT - GROUND_Y + 8)
+def merge_rects(rects):
+    """Обрезает прямоугольники по экрану и сливает пересекающиеся"""
+    merged = []
+    for r in rects:
+        r = r.clip(SCREEN_RECT)
+        if not r.width or not r.height:
+            continue
+        i = r.collidelist(merged)
+        while i != -1:
+            r = r.union(merged.pop(i))
+            i = r.collidelist(merged)
+        merged.append(r)
+    return merged
+
+def cut_rows(rect, rows):
+    """Части rect выше и ниже строк rows = (верх, низ); rows None - весь rect"""
+    if rows is None:
+        return [rect]
+    top, bottom = rows
+    parts = []
+    if rect.top < top:
+        parts.append(pygame.Rect(rect.x, rect.y, rect.width, min(rect.bottom, top) - rect.y))
+    if rect.bottom > bottom:
+        y = max(rect.top, bottom)
+        parts.append(pygame.Rect(rect.x, y, rect.width, rect.bottom - y))
+    return parts
+
+class DirtyRenderer:
+    """Кадр грязными прямоугольниками вместо полной перерисовки и flip.
+
+    В отдельной поверхности фона живут только слои, привязанные к экрану:
+    небо, облака, параллакс и фон лавы. Платформы и выход едут вместе с
+    миром, поэтому рисуются поверх фона каждый кадр, как спрайты. В фоне
+    перерисовываются только сдвинувшиеся облака, а на экран из фона
+    возвращаются эти области и области под прошлыми спрайтами (и под
+    платформами, если камера сдвинулась). Остальной экран остается от
+    прошлого кадра.
+
+    Слой параллакса меняется, только когда сдвигается на целый пиксель его
+    собственное смещение (камера * доля скорости слоя). Строки таких слоев
+    рисуются сразу на экран, без фона: рисовать их в фон и копировать было
+    бы вдвое дороже. Фон в этих строках помечается устаревшим (stale), и
+    до остановки камеры стирание в них тоже рисуется прямо на экран; когда
+    камера встанет, строки один раз собираются в фоне заново.
+
+        renderer.begin(screen, level, camera_x)   # фон, стирание прошлых спрайтов, платформы
+        renderer.mark(skin.draw(...))             # спрайты поверх
+        pygame.display.update(renderer.end())
+    """
+    def __init__(self):
+        self.bg = pygame.Surface(SCREEN_RECT.size).convert()
+        self.level = None
+        self.cam = 0
+        self.full = True     # фон не соответствует кадру - собрать целиком
+        self.cloud_rects = []
+        self.layer_pos = []  # целое смещение каждого слоя параллакса в фоне и на экране
+        self.stale = None    # строки (верх, низ), где фон отстал от экрана
+        self.world_rects = []  # платформы и выход на экране в прошлом кадре
+        self.drawn = []      # спрайты прошлого кадра - их надо стереть
+        self.restored = []   # области экрана, восстановленные из фона в этом кадре
+        self.reused = 0      # кадров, собранных из фона (для отладки)
+
+    def invalidate(self):
+        self.full = True
+
+    def paint(self, surface, rect):
+        """Рисует слои фона в rect поверхности (фона или экрана)"""
+        surface.set_clip(rect)
+        for band in sky_bands():
+            band = band.clip(rect)
+            if band:
+                surface.blit(sky_cache, band, band)
+        # Только облака, задевающие rect: остальные все равно обрезаются
+        idx = rect.collidelistall(self.cloud_rects)
+        if idx:
+            clouds.draw(surface, idx)
+        if parallax_enabled:
+            draw_parallax(surface, self.cam)
         surface.blit(lava_cache, (0, GROUND_Y))
-    
-    if len(lava_particles) < 20:
-        lava_particles.append({
-            'x': random.randint(0, SCREEN_WIDTH), 
-            'y': SCREEN_HEIGHT, 
-            's': random.randint(2, 6),
-            'speed': random.uniform(1.5, 3)
-        })
-        
-    for p in lava_particles[:]:
-        p['y'] -= p['speed']
-        if p['y'] < GROUND_Y:
-            lava_particles.remove(p)
+        surface.set_clip(None)
+
+    def begin(self, surface, level, cam_x):
+        """Обновляет фон, стирает прошлые спрайты и рисует платформы; level None - меню без уровня"""
+        cam = int(cam_x)
+        moved = cam != self.cam or level is not self.level
+        old_clouds = self.cloud_rects
+        self.cloud_rects = clouds.bounds()
+        layer_pos = [int(cam * layer[1]) for layer in PARALLAX_LAYERS] if parallax_enabled else []
+        drawn = self.drawn
+        self.drawn = []
+        self.level = level
+        self.cam = cam
+
+        if self.full or len(old_clouds) != len(self.cloud_rects):
+            self.paint(self.bg, SCREEN_RECT)
+            surface.blit(self.bg, (0, 0))
+            self.full = False
+            self.stale = None
+            self.restored = [SCREEN_RECT]
         else:
-            pygame.draw.circle(surface, COLOR_LAVA_BUBBLE, (p['x'], int(p['y'])), p['s'])
+            # Строки слоев параллакса, сдвинувшихся на экране
+            band = None
+            for i, (old, new) in enumerate(zip(self.layer_pos, layer_pos)):
+                if old != new:
+                    top, bottom = parallax_rows(i)
+                    band = (top, bottom) if band is None else (min(band[0], top), max(band[1], bottom))
+            stale = self.stale
+            if band is not None:
+                stale = band if stale is None else (min(stale[0], band[0]), max(stale[1], band[1]))
+            elif not moved and stale is not None:
+                # Камера встала - фон догоняет экран
+                self.paint(self.bg, pygame.Rect(0, stale[0], SCREEN_WIDTH, stale[1] - stale[0]))
+                stale = None
+            self.stale = stale
+
+            dirty = []
+            for old, new in zip(old_clouds, self.cloud_rects):
+                if old != new:
+                    dirty += (old, new)
+            dirty = merge_rects(dirty)
+            for r in dirty:
+                for part in cut_rows(r, stale):
+                    self.paint(self.bg, part)
+            if moved:
+                drawn += self.world_rects
+            restore = merge_rects(dirty + drawn)
+            for r in restore:
+                # Вне устаревших строк - из фона, в них - прямо на экран (кроме band)
+                for part in cut_rows(r, stale):
+                    surface.blit(self.bg, part, part)
+                if stale is not None:
+                    inside = r.clip(0, stale[0], SCREEN_WIDTH, stale[1] - stale[0])
+                    for part in cut_rows(inside, band) if inside else ():
+                        self.paint(surface, part)
+            if band is not None:
+                band = pygame.Rect(0, band[0], SCREEN_WIDTH, band[1] - band[0])
+                self.paint(surface, band)
+                restore.append(band)
+            self.restored = restore
+            self.reused += 1
+        self.layer_pos = layer_pos
+
+        # Платформы и выход - поверх фона; на новом месте их надо вывести
+        self.world_rects = []
+        if level is not None:
+            self.world_rects = draw_platforms(surface, level.platforms, cam)
+            if level.exit_zone is not None:
+                self.world_rects.append(draw_exit(surface, level.exit_zone, cam))
+            if moved:
+                self.drawn += self.world_rects
+
+    def mark(self, rect):
+        """Область, нарисованная поверх фона в этом кадре"""
+        self.drawn.append(rect)
+
+    def end(self):
+        """Прямоугольники для pygame.display.update"""
+        if self.restored == [SCREEN_RECT]:
+            return self.restored
+        return merge_rects(self.restored + self.drawn)
 
 # --- ИГРОК ---
-class Player:
-    def __init__(self, x, keys_map, sprites):
-        self.target_h = SCREEN_HEIGHT * CHAR_SCALE
-        
-        self.idle_r = load_and_scale(sprites['idle'], self.target_h)
-        self.idle_l = pygame.transform.flip(self.idle_r, True, False)
-        
-        self.run_r = [load_and_scale(s, self.target_h) for s in sprites['run']]
-        self.run_l = [pygame.transform.flip(s, True, False) for s in self.run_r]
-        
-        self.jump_r = load_and_scale(sprites['jump'], self.target_h)
-        self.jump_l = pygame.transform.flip(self.jump_r, True, False)
-        
-        self.fall_r = load_and_scale(sprites['fall'], self.target_h)
-        self.fall_l = pygame.transform.flip(self.fall_r, True, False)
-        
-        self.start_x = x
-        self.keys = keys_map
-        self.rect = self.idle_r.get_rect()
-        
-        # СОБЫТИЙНАЯ МОДЕЛЬ: флаги вместо get_pressed()
-        self.moving_left = False
-        self.moving_right = False
-        
-        self.reset(0)
-
-    def reset(self, y_pos):
-        self.rect.x = self.start_x
-        self.rect.bottom = y_pos
-        self.vel_y = 0
-        self.vel_x = 0
-        self.on_ground = False
-        self.is_jumping = False
-        self.look_right = True
-        self.anim_timer = 0
-        self.coyote_timer = 0
-        self.was_moving = False
-        self.was_on_ground = True
-        # Сбрасываем флаги движения
-        self.moving_left = False
-        self.moving_right = False
-
-    def update(self, platforms):
-        # СОБЫТИЙНАЯ МОДЕЛЬ: используем флаги вместо get_pressed()
-        moving = False
-        self.vel_x = 0
-        
-        # Проверяем флаги движения
-        if self.moving_left:
-            self.vel_x = -MOVE_SPEED
-            self.look_right = False
-            moving = True
-        if self.moving_right:
-            self.vel_x = MOVE_SPEED
-            self.look_right = True
-            moving = True
-        
-        # Применяем горизонтальное движение
-        self.rect.x += self.vel_x
-        
-        # Горизонтальные коллизии
-        for p in platforms:
-            if self.rect.colliderect(p):
-                if self.vel_x > 0:
-                    self.rect.right = p.left
-                elif self.vel_x < 0:
-                    self.rect.left = p.right
-        
-        # Гравитация
-        self.vel_y += GRAVITY
-        self.vel_y = min(self.vel_y, 15)
+GHOST_ALPHA = 110
+
+def sprite_items(sprites, target_h):
+    """Все пары (путь, высота) набора спрайтов - для пакетной загрузки"""
+    paths = [sprites['idle'], *sprites['run'], sprites['jump'], sprites['fall']]
+    return [(path, target_h) for path in paths]
+
+class PlayerSprites:
+    """Спрайты игрока; физика и хитбокс - в simulation.Player"""
+    def __init__(self, sprites, scale=1.0):
+        self.skin = sprites
+        self.scale = scale
+        self.target_h = SCREEN_HEIGHT * CHAR_SCALE * scale
+        self.scaled = {}  # масштаб -> PlayerSprites для кадра пониженного разрешения
+        self.ghost_images = {}  # кадр -> его полупрозрачная копия для призраков
         
-        # Применяем вертикальное движение
-        old_y = self.rect.y
-        self.rect.y += self.vel_y
+        # Кадры общие для всех игроков с тем же скином (assets.py);
+        # уменьшенные кадры грузятся по требованию и в атлас на диске не пишутся
+        if scale == 1.0:
+            assets.preload(sprite_items(sprites, self.target_h))
         
-        # Вертикальные коллизии
-        self.was_on_ground = self.on_ground
-        self.on_ground = False
+        self.idle_r = assets.sprite(sprites['idle'], self.target_h)
+        self.idle_l = assets.sprite(sprites['idle'], self.target_h, flip=True)
         
-        for p in platforms:
-            if self.rect.colliderect(p):
-                # Приземление на платформу
-                if self.vel_y > 0 and old_y + self.rect.height <= p.top + 8:
-                    self.rect.bottom = p.top
-                    self.vel_y = 0
-                    self.on_ground = True
-                    self.is_jumping = False
-                    self.coyote_timer = 6
-                    
-                # Удар головой
-                elif self.vel_y < 0 and old_y >= p.bottom - 8:
-                    self.rect.top = p.bottom
-                    self.vel_y = 0
-
-        # Coyote time
-        if not self.on_ground and self.was_on_ground:
-            self.coyote_timer = 6
-        elif not self.on_ground and self.coyote_timer > 0:
-            self.coyote_timer -= 1
+        self.run_r = [assets.sprite(s, self.target_h) for s in sprites['run']]
+        self.run_l = [assets.sprite(s, self.target_h, flip=True) for s in sprites['run']]
         
-        self.was_moving = moving
-        return moving
-
-    def try_jump(self):
-        if self.on_ground or self.coyote_timer > 0:
-            self.vel_y = JUMP_FORCE
-            self.is_jumping = True
-            self.on_ground = False
-            self.coyote_timer = 0
-
-    def draw(self, surface, cam_x, moving):
-        # ИСПРАВЛЕНИЕ: анимация обновляется только при движении
-        if moving and self.on_ground:
-            self.anim_timer += 1
+        self.jump_r = assets.sprite(sprites['jump'], self.target_h)
+        self.jump_l = assets.sprite(sprites['jump'], self.target_h, flip=True)
         
-        # Выбор спрайта с четкой логикой
-        if not self.on_ground:
+        self.fall_r = assets.sprite(sprites['fall'], self.target_h)
+        self.fall_l = assets.sprite(sprites['fall'], self.target_h, flip=True)
+
+    def at_scale(self, scale):
+        skin = self.scaled.get(scale)
+        if skin is None:
+            skin = self.scaled[scale] = PlayerSprites(self.skin, scale)
+        return skin
+
+    def pose_image(self, pose, look_right, frame):
+        """Кадр позы из записи траекторий: 'idle', 'run', 'jump' или 'fall'"""
+        img = getattr(self, pose + ('_r' if look_right else '_l'))
+        if pose == 'run':
+            return img[frame % len(img)]
+        return img
+
+    def draw_ghost(self, surface, state, cam_x, scale=1.0):
+        """Полупрозрачный призрак; state - из GhostPlayback.states"""
+        if scale != self.scale:
+            return self.at_scale(scale).draw_ghost(surface, state, cam_x, scale)
+        x, y, pose, look_right, frame = state
+        img = self.pose_image(pose, look_right, frame)
+        ghost = self.ghost_images.get(img)
+        if ghost is None:
+            ghost = self.ghost_images[img] = img.copy()
+            ghost.set_alpha(GHOST_ALPHA)
+        return surface.blit(ghost, (int((x - cam_x) * scale), int(y * scale)))
+
+    def draw(self, surface, player, cam_x, moving, pos=None, scale=1.0):
+        if scale != self.scale:
+            return self.at_scale(scale).draw(surface, player, cam_x, moving, pos, scale)
+        # Выбор спрайта с четкой логикой (anim_timer двигает симуляция)
+        if not player.on_ground:
             # В воздухе
-            if self.vel_y < -2:
-                img = self.jump_r if self.look_right else self.jump_l
+            if player.vel_y < -2:
+                img = self.jump_r if player.look_right else self.jump_l
             else:
-                img = self.fall_r if self.look_right else self.fall_l
+                img = self.fall_r if player.look_right else self.fall_l
         elif moving:
             # Бег
-            frames = self.run_r if self.look_right else self.run_l
-            frame_index = (self.anim_timer // 8) % len(frames)
+            frames = self.run_r if player.look_right else self.run_l
+            frame_index = (player.anim_timer // 8) % len(frames)
             img = frames[frame_index]
         else:
             # Стоит
-            img = self.idle_r if self.look_right else self.idle_l
+            img = self.idle_r if player.look_right else self.idle_l
         
-        surface.blit(img, (int(self.rect.x - cam_x), int(self.rect.y)))
+        # pos - интерполированная позиция между тиками логики
+        x, y = pos if pos is not None else player.rect.topleft
+        return surface.blit(img, (int((x - cam_x) * scale), int(y * scale)))
 
 
 # --- НАСТРОЙКА ИГРОКОВ ---
-# УПРОЩЕННАЯ поддержка клавиш - только константы Pygame
-p1 = Player(100, 
+SKIN_P1 = {'idle': 'sprites/stoit1.png', 'run': ['sprites/run1.png', 'sprites/run2.png'], 
+           'jump': 'sprites/jumpup.png', 'fall': 'sprites/falldown.png'}
+SKIN_P2 = {'idle': 'sprites/Kstoit.png', 'run': ['sprites/Krun1.png', 'sprites/Krun2.png'], 
+           'jump': 'sprites/Kjump1.png', 'fall': 'sprites/Kfall1.png'}
+
+# УПРОЩЕННАЯ поддержка клавиш - только константы Pygame.
+# Раскладки живых игроков по порядку; кому не хватило - бот
+KEY_MAPS = [
     {
         'left': [pygame.K_a, ord('a')],  # A + русская А
         'right': [pygame.K_d, ord('d')],  # D + русская В
         'jump': [pygame.K_w, pygame.K_SPACE, ord('w')]  # W + пробел + русская Ц
     },
-    {'idle': 'sprites/stoit1.png', 'run': ['sprites/run1.png', 'sprites/run2.png'], 
-     'jump': 'sprites/jumpup.png', 'fall': 'sprites/falldown.png'}
-)
-
-p2 = Player(200, 
     {
         'left': [pygame.K_LEFT, pygame.K_j],  # Стрелка влево + J
         'right': [pygame.K_RIGHT, pygame.K_l],  # Стрелка вправо + L
         'jump': [pygame.K_UP, pygame.K_i, pygame.K_RCTRL]  # Стрелка вверх + I + RCtrl
     },
-    {'idle': 'sprites/Kstoit.png', 'run': ['sprites/Krun1.png', 'sprites/Krun2.png'], 
-     'jump': 'sprites/Kjump1.png', 'fall': 'sprites/Kfall1.png'}
-)
-
-# --- ГЕНЕРАЦИЯ УРОВНЯ ---
-platforms = []
-exit_zone = pygame.Rect(0, 0, 0, 0)
-level_end_x = 0
-
-def generate_level():
-    """ИСПРАВЛЕННАЯ генерация - интересные, но проходимые платформы"""
-    global platforms, exit_zone, level_end_x
-    platforms = []
-    
-    # Стартовая платформа - широкая и низкая
-    start_plat = pygame.Rect(50, GROUND_Y - 120, 450, 40)
-    platforms.append(start_plat)
-    
-    curr_x = start_plat.right
-    curr_y = start_plat.y
-    
-    # ИСПРАВЛЕНИЕ: Генерация платформ с гарантией проходимости
-    platform_count = 15
-    
-    for i in range(platform_count):
-        # Ширина платформы - достаточная для приземления
-        w = random.randint(180, 320)
-        
-        # Расстояние - всегда проходимое (тест: jump_distance ~= 120-140px при vel=6)
-        gap = random.randint(80, 160)
-        
-        # Изменение высоты - контролируемое
-        # Максимальный прыжок вверх ~= 140px при JUMP_FORCE=-16
-        # Позволяем прыгать вниз свободно, вверх - ограниченно
-        
-        if i < 3:
-            # Первые платформы - легкие
-            delta_h = random.randint(-40, 20)
-        elif i < 8:
-            # Средние - разнообразные
-            delta_h = random.randint(-80, 60)
+    {'left': [pygame.K_f], 'right': [pygame.K_h], 'jump': [pygame.K_t]},
+    {'left': [pygame.K_KP4], 'right': [pygame.K_KP6], 'jump': [pygame.K_KP8]},
+]
+KEY_HELP = ["A/D/W/Space", "Arrows or I(up)/J(left)/L(right)", "F/H/T", "Num4/Num6/Num8"]
+# Раскладок на всех не хватает - остальные игроки по умолчанию боты
+BOT_COUNT = int_option("--bots", max(0, PLAYER_COUNT - len(KEY_MAPS)),
+                       max(0, PLAYER_COUNT - len(KEY_MAPS)), PLAYER_COUNT)
+HUMAN_COUNT = PLAYER_COUNT - BOT_COUNT
+
+# Игроки, источник уровней и симуляция создаются в start_game()
+players = None
+bots = []
+level_source = None
+sim = None
+player_sprites = None
+
+# В сетевой игре клавиши обоих наборов управляют своим игроком через
+# отдельный "пульт": его ввод уходит в RollbackSession, а не в игрока напрямую.
+# Сетевая партия - всегда на двоих, --players и --bots в ней не действуют
+net_pad = Player(0, keys_map={k: KEY_MAPS[0][k] + KEY_MAPS[1][k] for k in KEY_MAPS[0]})
+
+def dispatch_key(key_table, key, pressed):
+    """Нажатие или отпускание клавиши у всех игроков, кому она назначена"""
+    for p, action in key_table.get(key, ()):
+        if action == 'jump':
+            if pressed:
+                p.try_jump()
+        elif action == 'left':
+            p.moving_left = pressed
         else:
-            # Последние - сложнее
-            delta_h = random.randint(-100, 80)
-        
-        new_y = curr_y - delta_h
-        
-        # Границы по высоте
-        new_y = max(100, min(new_y, GROUND_Y - 80))
-        
-        # Проверка проходимости по вертикали
-        y_diff = abs(new_y - curr_y)
-        if new_y < curr_y and y_diff > 120:
-            # Слишком высоко - корректируем
-            new_y = curr_y - 110
-        
-        curr_x += gap
-        platforms.append(pygame.Rect(curr_x, new_y, w, 40))
-        curr_y = new_y
-        curr_x += w
-
-    # Финишная платформа - большая и удобная
-    final_plat = pygame.Rect(curr_x + 150, GROUND_Y - 130, 500, 40)
-    platforms.append(final_plat)
-    
-    exit_zone = pygame.Rect(final_plat.centerx - 60, final_plat.top - 120, 120, 120)
-    level_end_x = final_plat.right + 200
-    
-    # Правильный респаун на СТАРТОВОЙ платформе
-    p1.reset(start_plat.top)
-    p2.reset(start_plat.top)
+            p.moving_right = pressed
+
+def start_game():
+    """Игроки и партия по опциям командной строки; первый уровень строится здесь.
+
+    Хитбоксы (PLAYER_SIZES) совпадают с размерами кадров idle; нечетные
+    игроки - первый скин, четные - второй. Вся логика партии - в симуляции,
+    окно ее только рисует. Следующий уровень (и респаун после лавы)
+    строится заранее в фоне; бесконечный уровень сам дописывает платформы
+    по ходу игры, а уровень из файла открывается через mmap один раз на все
+    попытки.
+    """
+    global players, bots, level_source, sim
+    players = PlayerRegistry()
+    for i in range(PLAYER_COUNT):
+        players.add(Player(PLAYER_START_X[i % 2] + 20 * (i // 2), PLAYER_SIZES[i % 2],
+                           KEY_MAPS[i] if i < HUMAN_COUNT else None))
+    bots = players.players[HUMAN_COUNT:]
+    if LEVEL_FILE is not None:
+        from levelfile import FileLevels
+        level_source = FileLevels(LEVEL_FILE)
+        # Запись хранит только seed уровней - нарисованный вручную уровень по ней не построить
+        if RECORD_PATH and NET_PORT is None and level_source.level.seed is None:
+            option_error(f"--record: {LEVEL_FILE} is a hand-made level without a seed, "
+                         f"its session could not be replayed")
+    elif "--endless" in sys.argv:
+        level_source = EndlessLevels(LEVEL_SEED)
+    else:
+        level_source = LevelPrefetcher(seed=LEVEL_SEED)
+    sim = Simulation(players, levels=level_source)
+    return sim
+
+def start_net_sim(seed):
+    """Партия сетевой игры: seed общий для обоих пиров"""
+    global sim, level_source
+    level_source.close()
+    level_source = LevelPrefetcher(seed=seed)
+    sim = Simulation(players.players[:2], levels=level_source)
+    return sim
 
-# Создаем кэши
-create_sky_cache()
-create_lava_cache()
-generate_level()
+def start_net_session():
+    from netplay import RollbackSession, UdpTransport
+    transport = UdpTransport(NET_PORT, NET_PEER_ADDR)
+    return RollbackSession(start_net_sim, NET_PLAYER, transport, seed=LEVEL_SEED)
 
-camera_x = 0.0
+def startup():
+    """Окно, кэши фона и спрайты игроков; повторный вызов ничего не делает.
+
+    Инициализируется только видео (события идут вместе с ним), остальные
+    подсистемы pygame (звук, джойстики) игре не нужны и не поднимаются.
+    """
+    global screen, clock, player_sprites, clouds, lava
+    if screen is not None:
+        return screen
+    pygame.display.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.DOUBLEBUF | pygame.HWSURFACE)
+    pygame.display.set_caption("Кооп Платформер: Исправленная версия")
+    clock = pygame.time.Clock()
+
+    create_sky_cache()
+    create_lava_cache()
+    # Спрайты облаков и полосы параллакса - в формате экрана
+    clouds = CloudField(5)
+    lava = LavaParticles(capacity=20)
+    clouds.bake()
+    for i in range(len(PARALLAX_LAYERS)):
+        parallax_tile(i)
+
+    # Все кадры обоих игроков одной пачкой - один атлас на диске.
+    # Грузим после set_mode, чтобы кадры были в формате экрана
+    assets.preload(sprite_items(SKIN_P1, SCREEN_HEIGHT * CHAR_SCALE) + sprite_items(SKIN_P2, SCREEN_HEIGHT * CHAR_SCALE))
+    skins = [PlayerSprites(SKIN_P1), PlayerSprites(SKIN_P2)]
+    player_sprites = [skins[i % 2] for i in range(PLAYER_COUNT)]
+    return screen
+
+# --- КАДР ИГРЫ ---
+def draw_game(surface, sim, sprites, camera_x, moving, alpha, renderer=None, ghosts=None):
+    """Весь игровой кадр (без отладки): фон, платформы, лава, выход, призраки, игроки.
+
+    С renderer (DirtyRenderer) статичные слои берутся из его фона, а
+    рисуются только пузыри лавы и игроки. Без него при render_scale < 1
+    кадр рисуется в уменьшенную поверхность и растягивается на экран.
+    """
+    scale = 1.0
+    target = surface
+    if renderer is not None:
+        with profiler.section("draw_world"):
+            renderer.begin(surface, sim.level, camera_x)
+        with profiler.section("draw_lava"):
+            lava.draw(surface)
+            renderer.mark(LAVA_STRIP)
+    else:
+        scale = render_scale
+        if scale != 1.0:
+            target = frame_surface(scale)
+        with profiler.section("draw_world"):
+            draw_world(target, camera_x, scale)
+        with profiler.section("draw_platforms"):
+            draw_platforms(target, sim.platforms, camera_x, scale)
+        with profiler.section("draw_lava"):
+            draw_lava(target, camera_x, scale)
+
+        # Зона выхода (у бесконечного уровня ее нет)
+        if sim.exit_zone is not None:
+            draw_exit(target, sim.exit_zone, camera_x, scale)
+
+    # Призраки (GhostPlayback) под игроками
+    if ghosts is not None:
+        with profiler.section("draw_ghosts"):
+            for state, skin in zip(ghosts.states(alpha), sprites):
+                rect = skin.draw_ghost(target, state, camera_x, scale)
+                if renderer is not None:
+                    renderer.mark(rect)
+
+    # Игроки
+    with profiler.section("draw_players"):
+        for player, skin, mv in zip(sim.players, sprites, moving):
+            rect = skin.draw(target, player, camera_x, mv, player.lerp_pos(alpha), scale)
+            if renderer is not None:
+                renderer.mark(rect)
+
+    if target is not surface:
+        with profiler.section("upscale"):
+            pygame.transform.scale(target, surface.get_size(), surface)
 
 # --- UI ФУНКЦИЯ ---
-def draw_ui(title_text, btn_text):
-    draw_world(screen, 0)
+def draw_ui(title_text, btn_text, renderer=None):
+    if renderer is not None:
+        renderer.begin(screen, None, 0)
+    else:
+        draw_world(screen, 0)
     
-    shadow = font_title.render(title_text, True, (0, 0, 0))
-    txt = font_title.render(title_text, True, (255, 255, 255))
-    screen.blit(shadow, (SCREEN_WIDTH//2 - txt.get_width()//2 + 4, 104))
-    screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, 100))
+    # Статичные надписи растеризуются один раз, дальше берутся из кэша
+    font_title = get_font(*FONT_TITLE)
+    shadow = text_cache.render(font_title, title_text, (0, 0, 0))
+    txt = text_cache.render(font_title, title_text, (255, 255, 255))
+    title_rect = screen.blit(shadow, (SCREEN_WIDTH//2 - txt.get_width()//2 + 4, 104))
+    title_rect.union_ip(screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, 100)))
     
-    btn_lbl = font_btn.render(btn_text, True, (255, 255, 255))
+    btn_lbl = text_cache.render(get_font(*FONT_BTN), btn_text, (255, 255, 255))
     btn_w = btn_lbl.get_width() + 60
     btn_h = 80
     btn_rect = pygame.Rect(SCREEN_WIDTH//2 - btn_w//2, 350, btn_w, btn_h)
@@ -441,180 +833,249 @@ def draw_ui(title_text, btn_text):
     pygame.draw.rect(screen, (255, 255, 255), btn_rect, 3, 20)
     screen.blit(btn_lbl, (btn_rect.centerx - btn_lbl.get_width()//2, 
                           btn_rect.centery - btn_lbl.get_height()//2))
+    if renderer is not None:
+        renderer.mark(title_rect)
+        renderer.mark(btn_rect)
     
     return btn_rect, is_hover
 
+def export_profile(path="profile"):
+    """Пишет журнал кадров профайлера: CSV и Chrome trace (chrome://tracing)"""
+    profiler.export_csv(path + ".csv")
+    profiler.export_chrome_trace(path + ".trace.json")
+    print(f"profile: {len(profiler.frames)} frames -> {path}.csv, {path}.trace.json")
+
 # --- MAIN LOOP ---
-running = True
-last_keys_pressed = []  # Для отладки
-shift_held = False  # Для комбинации Shift+0
+def main():
+    global current_state, show_debug
+    main_start = time.perf_counter()
+    start_game()
+    startup()
+    running = True
+    last_keys_pressed = []  # Для отладки
+    shift_held = False  # Для комбинации Shift+0
+    
+    # Логика идет фиксированными тиками, кадры рисуются с интерполяцией
+    stepper = FixedTimestep()
+    moving = [False] * len(sim.players)
+    # Сетевая игра: тики идут через сессию с откатом, меню - ожидание пира
+    session = start_net_session() if NET_PORT is not None else None
+    renderer = DirtyRenderer() if DIRTY_RECTS else None
 
-while running:
-    click = False
+    # Качество графики по времени кадра; --quality фиксирует уровень
+    def on_quality(settings):
+        apply_quality(settings)
+        if renderer is not None:
+            renderer.invalidate()
+    # DirtyRenderer рисует в полном разрешении - уровни без render_scale
+    levels = full_resolution_levels() if renderer is not None else QUALITY_LEVELS
+    governor = QualityGovernor(levels, on_change=on_quality)
+    if QUALITY is not None:
+        # Выпавший в полном разрешении уровень совпадает с предыдущим оставшимся
+        wanted = QUALITY_NAMES.index(QUALITY)
+        governor.enabled = False
+        governor.set_level(max(i for i, q in enumerate(levels) if QUALITY_NAMES.index(q['name']) <= wanted))
+    # Клавиша -> (игрок, действие) одним поиском в словаре
+    key_table = (players if session is None else PlayerRegistry([net_pad])).key_table()
+    # Запись начинается до клика "ИГРАТЬ", чтобы первый уровень тоже попал в лог.
+    # В сети не пишем: откат пересчитывает тики, и лог бы их дублировал
+    recorder = tracer = ghosts = None
+    if RECORD_PATH and session is None:
+        from replay import InputRecorder
+        recorder = InputRecorder(sim)
+    # Траектории для призраков и разбора забегов; призраки - из прошлой такой записи
+    if (TRACE_PATH or GHOST_PATH) and session is None:
+        from ghost import TraceRecorder, TraceFile, GhostPlayback
+        if TRACE_PATH:
+            tracer = TraceRecorder(TRACE_PATH, sim)
+        if GHOST_PATH:
+            ghosts = GhostPlayback(TraceFile(GHOST_PATH))
+    last_time = time.perf_counter()
     
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    while running:
+        profiler.begin_frame()
+        click = False
+        now = time.perf_counter()
+        frame_time = now - last_time
+        last_time = now
+    
+        with profiler.section("events"):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
             
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            click = True
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    click = True
         
-        # Отслеживание Shift
-        if event.type == pygame.KEYDOWN:
-            if event.key in [pygame.K_LSHIFT, pygame.K_RSHIFT]:
-                shift_held = True
-        if event.type == pygame.KEYUP:
-            if event.key in [pygame.K_LSHIFT, pygame.K_RSHIFT]:
-                shift_held = False
+                # Отслеживание Shift
+                if event.type == pygame.KEYDOWN:
+                    if event.key in [pygame.K_LSHIFT, pygame.K_RSHIFT]:
+                        shift_held = True
+                if event.type == pygame.KEYUP:
+                    if event.key in [pygame.K_LSHIFT, pygame.K_RSHIFT]:
+                        shift_held = False
         
-        # Переключение отладки по Shift+0
-        if event.type == pygame.KEYDOWN and event.key == pygame.K_0 and shift_held:
-            show_debug = not show_debug
-        
-        # Диагностика
-        if event.type == pygame.KEYDOWN and show_debug:
-            last_keys_pressed.append(event.key)
-            if len(last_keys_pressed) > 10:
-                last_keys_pressed.pop(0)
-        
-        # СОБЫТИЙНАЯ ОБРАБОТКА УПРАВЛЕНИЯ (macOS-friendly!)
-        if current_state == STATE_PLAYING:
-            if event.type == pygame.KEYDOWN:
-                # Прыжки
-                if event.key in p1.keys['jump']:
-                    p1.try_jump()
-                if event.key in p2.keys['jump']:
-                    p2.try_jump()
+                # Переключение отладки по Shift+0
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_0 and shift_held:
+                    show_debug = not show_debug
                 
-                # Движение НАЖАТО
-                if event.key in p1.keys['left']:
-                    p1.moving_left = True
-                if event.key in p1.keys['right']:
-                    p1.moving_right = True
-                if event.key in p2.keys['left']:
-                    p2.moving_left = True
-                if event.key in p2.keys['right']:
-                    p2.moving_right = True
-            
-            if event.type == pygame.KEYUP:
-                # Движение ОТПУЩЕНО
-                if event.key in p1.keys['left']:
-                    p1.moving_left = False
-                if event.key in p1.keys['right']:
-                    p1.moving_right = False
-                if event.key in p2.keys['left']:
-                    p2.moving_left = False
-                if event.key in p2.keys['right']:
-                    p2.moving_right = False
-
-    # --- ЛОГИКА ---
-    if current_state == STATE_MENU:
-        for c in clouds_list: 
-            c.update()
-        btn, hover = draw_ui("КООП ПЛАТФОРМЕР", "НАЧАТЬ ПРИКЛЮЧЕНИЕ")
-        if click and hover:
-            generate_level()
-            current_state = STATE_PLAYING
-
-    elif current_state == STATE_WIN:
-        for c in clouds_list: 
-            c.update()
-        btn, hover = draw_ui("ПОБЕДА!", "НОВЫЙ УРОВЕНЬ")
-        if click and hover:
-            generate_level()
-            current_state = STATE_PLAYING
-
-    elif current_state == STATE_PLAYING:
-        for c in clouds_list: 
-            c.update()
-        
-        # Обновление игроков
-        mv1 = p1.update(platforms)
-        mv2 = p2.update(platforms)
+                # Выгрузка профиля кадров по F9
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                    export_profile()
         
-        # Проверка смерти в лаве
-        if p1.rect.top > GROUND_Y + 50 or p2.rect.top > GROUND_Y + 50:
-            generate_level()
-            
-        # Плавная камера
-        target_cam = (p1.rect.centerx + p2.rect.centerx) / 2 - SCREEN_WIDTH / 2
-        target_cam = max(0.0, min(target_cam, level_end_x - SCREEN_WIDTH))
-        camera_x += (target_cam - camera_x) * 0.12
-
-        # Победа
-        if p1.rect.colliderect(exit_zone) and p2.rect.colliderect(exit_zone):
-            current_state = STATE_WIN
-
-        # --- ОТРИСОВКА ---
-        draw_world(screen, camera_x)
-        draw_platforms(screen, platforms, camera_x)
-        draw_lava(screen, camera_x)
+                # Диагностика
+                if event.type == pygame.KEYDOWN and show_debug:
+                    last_keys_pressed.append(event.key)
+                    if len(last_keys_pressed) > 10:
+                        last_keys_pressed.pop(0)
         
-        # Зона выхода
-        ex = exit_zone.copy()
-        ex.x -= int(camera_x)
-        pygame.draw.rect(screen, (255, 215, 0), ex, 4, border_radius=10)
+                # СОБЫТИЙНАЯ ОБРАБОТКА УПРАВЛЕНИЯ (macOS-friendly!)
+                if current_state == STATE_PLAYING and event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                    dispatch_key(key_table, event.key, event.type == pygame.KEYDOWN)
+
+        # --- ЛОГИКА (фиксированный шаг) ---
+        for _ in range(stepper.advance(frame_time)):
+            with profiler.section("clouds"):
+                clouds.update()
+            if session is not None:
+                # Тик с откатом; победа сразу ставит новый уровень у обоих пиров
+                with profiler.section("sim_step"):
+                    if session.advance(net_pad.input_bits()):
+                        net_pad.jump_pressed = False
+                        moving = session.moving
+                if current_state == STATE_PLAYING:
+                    with profiler.section("lava_update"):
+                        lava.update()
+            elif current_state == STATE_PLAYING:
+                with profiler.section("lava_update"):
+                    lava.update()
+                # Боты, игроки, смерть в лаве, плавная камера, победа
+                with profiler.section("sim_step"):
+                    if bots:
+                        edge_jump_bot(sim, bots)
+                    moving = sim.step()
+                if tracer is not None:
+                    tracer.record(sim)
+                if ghosts is not None:
+                    ghosts.follow(sim)
+                if sim.won:
+                    current_state = STATE_WIN
+                    break
+        alpha = stepper.alpha
         
-        # Игроки
-        p1.draw(screen, camera_x, mv1)
-        p2.draw(screen, camera_x, mv2)
+        if current_state == STATE_MENU and session is not None:
+            with profiler.section("draw_ui"):
+                draw_ui("ОЖИДАНИЕ ИГРОКА", NET_PEER, renderer)
+            if session.connected:
+                current_state = STATE_PLAYING
+
+        elif current_state == STATE_MENU:
+            with profiler.section("draw_ui"):
+                btn, hover = draw_ui("КООП ПЛАТФОРМЕР", "НАЧАТЬ ПРИКЛЮЧЕНИЕ", renderer)
+            if click and hover:
+                sim.new_level()
+                current_state = STATE_PLAYING
+
+        elif current_state == STATE_WIN:
+            with profiler.section("draw_ui"):
+                btn, hover = draw_ui("ПОБЕДА!", "НОВЫЙ УРОВЕНЬ", renderer)
+            if click and hover:
+                sim.new_level()
+                current_state = STATE_PLAYING
+
+        elif current_state == STATE_PLAYING:
+            camera_x = sim.camera_at(alpha)
+
+            # --- ОТРИСОВКА ---
+            draw_game(screen, sim, player_sprites, camera_x, moving, alpha, renderer, ghosts)
         
-        # ОТЛАДОЧНАЯ ИНФОРМАЦИЯ (Shift+0 для включения/выключения)
-        if show_debug:
-            y_offset = 10
-            
-            # Информация о системе
-            platform_name = "macOS" if IS_MACOS else ("Windows" if IS_WINDOWS else "Linux")
-            debug_sys = font_debug.render(f"Platform: {platform_name} | Shift+0 to toggle | EVENT-DRIVEN MODEL", True, (255, 255, 0))
-            screen.blit(debug_sys, (10, y_offset))
-            y_offset += 20
+            # ОТЛАДОЧНАЯ ИНФОРМАЦИЯ (Shift+0 для включения/выключения)
+            if show_debug:
+                y_offset = 10
+                font_debug = get_font(*FONT_DEBUG)
             
-            # Информация о клавишах
-            debug_text = font_debug.render("Pressed keys (event.key codes):", True, (255, 255, 0))
-            screen.blit(debug_text, (10, y_offset))
-            y_offset += 20
-            
-            if last_keys_pressed:
-                keys_str = ", ".join([str(k) for k in last_keys_pressed[-5:]])
-                debug_text2 = font_debug.render(f"Last: {keys_str}", True, (255, 255, 0))
-                screen.blit(debug_text2, (10, y_offset))
+                # Информация о системе
+                platform_name = "macOS" if IS_MACOS else ("Windows" if IS_WINDOWS else "Linux")
+                text_cache.draw(screen, font_debug, f"Platform: {platform_name} | Shift+0 to toggle | EVENT-DRIVEN MODEL", (255, 255, 0), (10, y_offset))
                 y_offset += 20
             
-            # Константы стрелок
-            debug_text3 = font_debug.render(f"pygame.K_UP={pygame.K_UP}, K_LEFT={pygame.K_LEFT}, K_RIGHT={pygame.K_RIGHT}", True, (255, 255, 0))
-            screen.blit(debug_text3, (10, y_offset))
-            y_offset += 20
+                # Информация о клавишах
+                text_cache.draw(screen, font_debug, "Pressed keys (event.key codes):", (255, 255, 0), (10, y_offset))
+                y_offset += 20
             
-            # Альтернативные управления
-            debug_alt = font_debug.render(f"P1: A/D/W/Space | P2: Arrows or I(up)/J(left)/L(right)", True, (255, 200, 0))
-            screen.blit(debug_alt, (10, y_offset))
-            y_offset += 20
+                if last_keys_pressed:
+                    keys_str = ", ".join([str(k) for k in last_keys_pressed[-5:]])
+                    text_cache.draw(screen, font_debug, f"Last: {keys_str}", (255, 255, 0), (10, y_offset))
+                    y_offset += 20
             
-            # Флаги движения (самое важное для диагностики!)
-            debug_flags = font_debug.render(
-                f"P1 flags: left={p1.moving_left}, right={p1.moving_right} | " +
-                f"P2 flags: left={p2.moving_left}, right={p2.moving_right}", 
-                True, (0, 255, 0)
-            )
-            screen.blit(debug_flags, (10, y_offset))
-            y_offset += 20
+                # Константы стрелок
+                text_cache.draw(screen, font_debug, f"pygame.K_UP={pygame.K_UP}, K_LEFT={pygame.K_LEFT}, K_RIGHT={pygame.K_RIGHT}", (255, 255, 0), (10, y_offset))
+                y_offset += 20
             
-            # Позиции игроков
-            debug_text4 = font_debug.render(
-                f"P1: x={int(p1.rect.x)}, y={int(p1.rect.y)}, vel_x={p1.vel_x:.1f}, ground={p1.on_ground}", 
-                True, (100, 200, 255)
-            )
-            screen.blit(debug_text4, (10, y_offset))
-            y_offset += 20
+                # Альтернативные управления
+                controls_help = " | ".join(f"P{i + 1}: {KEY_HELP[i]}" for i in range(HUMAN_COUNT))
+                if BOT_COUNT:
+                    controls_help += f" | P{HUMAN_COUNT + 1}-P{PLAYER_COUNT}: bot"
+                text_cache.draw(screen, font_debug, controls_help, (255, 200, 0), (10, y_offset))
+                y_offset += 20
             
-            debug_text5 = font_debug.render(
-                f"P2: x={int(p2.rect.x)}, y={int(p2.rect.y)}, vel_x={p2.vel_x:.1f}, ground={p2.on_ground}", 
-                True, (255, 100, 200)
-            )
-            screen.blit(debug_text5, (10, y_offset))
+                # Флаги движения (самое важное для диагностики!)
+                for i, p in enumerate(sim.players):
+                    text_cache.draw(
+                        screen, font_debug,
+                        f"P{i + 1}: x={p.rect.x}, y={p.rect.y}, vel_x={p.vel_x:.1f}, "
+                        f"ground={p.on_ground} | flags: left={p.moving_left}, right={p.moving_right}",
+                        PLAYER_COLORS[i % 2], (10, y_offset)
+                    )
+                    y_offset += 20
+
+                if ghosts is not None:
+                    text_cache.draw(screen, font_debug, ghosts.describe(), (200, 200, 200), (10, y_offset))
+                    y_offset += 20
+
+                # Решения губернатора качества
+                for line in governor.describe():
+                    text_cache.draw(screen, font_debug, line, (255, 255, 255), (10, y_offset))
+                    y_offset += 20
+                
+                # Профайлер: среднее/p95/p99 по подсистемам и график кадра (F9 - выгрузка)
+                profiler.draw_overlay(screen, get_font(*FONT_MONO), SCREEN_WIDTH - 330, 10)
+                if renderer is not None:
+                    # Оверлей пишет по всему экрану - выводим кадр целиком
+                    renderer.mark(SCREEN_RECT)
 
-    pygame.display.flip()
-    clock.tick(60)
+        with profiler.section("flip"):
+            if renderer is not None:
+                pygame.display.update(renderer.end())
+            else:
+                pygame.display.flip()
+        profiler.end_frame()
+        governor.update(profiler.frame_ms[-1])
+        if "--first-frame" in sys.argv:
+            # Замер запуска: импорт, startup() и первый кадр, затем выход
+            now = time.perf_counter()
+            print(f"import {(main_start - IMPORT_START) * 1000:.1f} ms, "
+                  f"first frame {(now - IMPORT_START) * 1000:.1f} ms")
+            running = False
+        clock.tick(FPS_LIMIT)
+    
+    if "--profile" in sys.argv:
+        export_profile()
+    if recorder is not None:
+        recorder.log.save(RECORD_PATH)
+        print(f"recording: {recorder.log.ticks} ticks, {len(recorder.log.level_seeds)} levels -> {RECORD_PATH}")
+    if tracer is not None:
+        tracer.close()
+        print(f"trace: {tracer.total_ticks} ticks, {tracer.bytes} bytes -> {TRACE_PATH}")
+    if ghosts is not None:
+        ghosts.trace.close()
+    if session is not None:
+        print("netplay:", session.stats())
+        session.transport.close()
 
-pygame.quit()
-sys.exit()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
+    if level_source is not None:
+        level_source.close()
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,340 @@
+"""Сетевой кооп по UDP с откатом (rollback netcode).
+
+Каждый пир считает симуляцию сам и управляет своим игроком. Ввод - байт
+INPUT_* на тик, как в записи сессий. Пир шлет все свои еще не
+подтвержденные байты в каждом пакете, поэтому потерянный пакет
+перекрывается следующим. Чужой ввод, которого еще нет, предсказывается
+(последнее известное движение, без прыжка). Когда настоящий ввод приходит
+и расходится с предсказанием, партия откатывается к снимку того тика
+(Simulation.snapshot) и пересчитывается до текущего. Если чужой ввод
+отстает больше чем на MAX_ROLLBACK тиков, пир ждет (stall), а не уходит
+дальше. Пиры сверяют CRC подтвержденных состояний, и рассинхрон сразу
+виден в статистике.
+
+    python movement.py --net 7001 127.0.0.1:7002 --player 0   # игрок 1 (выбирает seed)
+    python movement.py --net 7002 127.0.0.1:7001 --player 1   # игрок 2
+
+    python netplay.py --test [тиков] [задержка мс] [потери]  # два процесса через loopback
+"""
+import sys
+import json
+import time
+import zlib
+import heapq
+import random
+import socket
+import struct
+import subprocess
+
+from simulation import TICK_RATE, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP
+
+MAGIC = b"BGNP"
+# magic, seed, ack (последний подтвержденный тик пира), первый тик ввода,
+# тик и CRC подтвержденного состояния (-1 - еще нет), байтов ввода
+PACKET = struct.Struct("<4sIiIiIH")
+INPUT_DELAY = 2      # свой ввод применяется через столько тиков - меньше откатов
+MAX_ROLLBACK = 8     # дальше вперед чужого ввода не уходим
+MAX_SEND = 120       # байтов ввода в одном пакете
+CRC_KEEP = 2 * TICK_RATE
+
+# --- ТРАНСПОРТ ---
+class UdpTransport:
+    """Неблокирующий UDP-сокет с одним пиром"""
+    def __init__(self, port, peer, host="0.0.0.0"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.peer = peer
+
+    def send(self, data):
+        try:
+            self.sock.sendto(data, self.peer)
+        except OSError:
+            # Пир еще не поднялся (ICMP unreachable) - пакет просто потерян
+            pass
+
+    def receive(self):
+        packets = []
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(2048)
+            except (BlockingIOError, ConnectionResetError):
+                return packets
+            packets.append(data)
+
+    def close(self):
+        self.sock.close()
+
+class LossyTransport:
+    """Шим для проверки: задержка, джиттер и потери исходящих пакетов"""
+    def __init__(self, inner, latency=0.05, jitter=0.01, loss=0.1, rng=None):
+        self.inner = inner
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng if rng is not None else random.Random()
+        self.queue = []  # (когда отправить, номер, данные)
+        self.seq = 0
+
+    def pump(self):
+        now = time.perf_counter()
+        while self.queue and self.queue[0][0] <= now:
+            self.inner.send(heapq.heappop(self.queue)[2])
+
+    def send(self, data):
+        if self.rng.random() >= self.loss:
+            self.seq += 1
+            due = time.perf_counter() + self.latency + self.jitter * self.rng.random()
+            heapq.heappush(self.queue, (due, self.seq, data))
+        self.pump()
+
+    def receive(self):
+        self.pump()
+        return self.inner.receive()
+
+    def close(self):
+        self.inner.close()
+
+# --- СЕССИЯ С ОТКАТОМ ---
+class RollbackSession:
+    """Кооп двух пиров: предсказание чужого ввода и откат по снимкам.
+
+    make_sim(seed) строит Simulation; seed выбирает игрок 0 и передает
+    в каждом пакете, игрок 1 строит партию по первому пакету.
+    """
+    def __init__(self, make_sim, local_index, transport, seed=None,
+                 input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK):
+        self.make_sim = make_sim
+        self.local = local_index
+        self.remote = 1 - local_index
+        self.transport = transport
+        self.max_rollback = max_rollback
+        self.seed = None
+        self.sim = None
+        self.connected = False
+
+        self.frame = 0                          # следующий тик к расчету
+        self.local_inputs = [0] * input_delay   # тик -> свой ввод
+        self.remote_inputs = []                 # подтвержденный чужой ввод подряд с тика 0
+        self.remote_pending = {}                # пришедший не по порядку
+        self.predicted = {}                     # тик -> предсказанный чужой ввод
+        self.snapshots = {}                     # тик -> снимок перед тиком
+        self.rollback_from = None
+        self.remote_ack = -1                    # до какого тика пир получил наш ввод
+
+        self.crcs = {}                          # тик -> CRC подтвержденного состояния
+        self.peer_crcs = {}
+        self.sent_crc = (-1, 0)
+
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.max_depth = 0
+        self.stalls = 0
+        self.desyncs = 0
+        self.checked = 0
+        self.moving = [False, False]
+
+        if local_index == 0:
+            self.start(random.getrandbits(32) if seed is None else seed)
+
+    def start(self, seed):
+        self.seed = seed
+        self.sim = self.make_sim(seed)
+
+    # --- СЕТЬ ---
+    def send(self):
+        first = self.remote_ack + 1
+        data = bytes(self.local_inputs[first:first + MAX_SEND])
+        crc_tick, crc = self.sent_crc
+        header = PACKET.pack(MAGIC, self.seed or 0, len(self.remote_inputs) - 1, first, crc_tick, crc, len(data))
+        self.transport.send(header + data)
+
+    def poll(self):
+        for packet in self.transport.receive():
+            if len(packet) < PACKET.size:
+                continue
+            magic, seed, ack, first, crc_tick, crc, count = PACKET.unpack_from(packet)
+            if magic != MAGIC:
+                continue
+            if self.sim is None:
+                self.start(seed)
+            self.connected = True
+            self.remote_ack = max(self.remote_ack, ack)
+            if crc_tick >= 0:
+                self.peer_crcs[crc_tick] = crc
+            inputs = packet[PACKET.size:PACKET.size + count]
+            for i, bits in enumerate(inputs):
+                if first + i >= len(self.remote_inputs):
+                    self.remote_pending[first + i] = bits
+            self.confirm_remote()
+
+    def confirm_remote(self):
+        while len(self.remote_inputs) in self.remote_pending:
+            tick = len(self.remote_inputs)
+            bits = self.remote_pending.pop(tick)
+            self.remote_inputs.append(bits)
+            if tick < self.frame and self.predicted.get(tick) != bits:
+                # Предсказание не сбылось: пересчитать с этого тика
+                if self.rollback_from is None or tick < self.rollback_from:
+                    self.rollback_from = tick
+
+    # --- ТИКИ ---
+    def predict(self):
+        """Чужой ввод, которого еще нет: то же движение, прыжок не повторяем"""
+        last = self.remote_inputs[-1] if self.remote_inputs else 0
+        return last & (INPUT_LEFT | INPUT_RIGHT)
+
+    def simulate(self, tick):
+        sim = self.sim
+        self.snapshots[tick] = sim.snapshot()
+        if tick < len(self.remote_inputs):
+            remote = self.remote_inputs[tick]
+        else:
+            remote = self.predicted[tick] = self.predict()
+        bits = [0, 0]
+        bits[self.local] = self.local_inputs[tick]
+        bits[self.remote] = remote
+        for p, b in zip(sim.players, bits):
+            p.apply_input(b)
+        self.moving = sim.step()
+        # В сети экрана победы нет: новый уровень сразу и одинаково у обоих
+        if sim.won:
+            sim.new_level()
+
+    def rollback(self):
+        start = self.rollback_from
+        self.rollback_from = None
+        self.sim.restore(self.snapshots[start])
+        for tick in range(start, self.frame):
+            self.simulate(tick)
+        depth = self.frame - start
+        self.rollbacks += 1
+        self.resimulated += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def advance(self, local_bits):
+        """Один тик партии со своим вводом; False - тик не сделан (нет связи или ждем пира)"""
+        self.poll()
+        if not self.connected or self.sim is None:
+            self.send()
+            return False
+        if self.rollback_from is not None:
+            self.rollback()
+        if self.frame >= len(self.remote_inputs) + self.max_rollback:
+            self.stalls += 1
+            self.send()
+            return False
+        self.local_inputs.append(local_bits)
+        self.simulate(self.frame)
+        self.frame += 1
+        self.check_sync()
+        self.send()
+        return True
+
+    def check_sync(self):
+        """CRC состояния, до которого весь ввод подтвержден; сверка с пиром"""
+        tick = min(len(self.remote_inputs), self.frame - 1)
+        if tick >= 0 and tick not in self.crcs and tick in self.snapshots:
+            self.crcs[tick] = zlib.crc32(self.snapshots[tick])
+            self.sent_crc = (tick, self.crcs[tick])
+        for tick, crc in list(self.peer_crcs.items()):
+            if tick in self.crcs:
+                self.checked += 1
+                if self.crcs[tick] != crc:
+                    self.desyncs += 1
+                del self.peer_crcs[tick]
+        # Старые снимки и предсказания больше не понадобятся; CRC ждут
+        # чужих еще CRC_KEEP тиков - пакеты пира приходят с задержкой
+        old = min(len(self.remote_inputs), self.frame) - 1
+        for store, keep in ((self.snapshots, 1), (self.predicted, 1), (self.crcs, CRC_KEEP), (self.peer_crcs, CRC_KEEP)):
+            for tick in [t for t in store if t < old - keep]:
+                del store[tick]
+
+    def synced(self, ticks):
+        """Оба пира получили весь ввод до тика ticks и досчитали его"""
+        return self.frame >= ticks and len(self.remote_inputs) >= ticks and self.remote_ack >= ticks - 1
+
+    def finish(self):
+        """Пересчет с подтвержденным вводом после остановки тиков"""
+        self.poll()
+        if self.rollback_from is not None:
+            self.rollback()
+        self.send()
+
+    def stats(self):
+        return {'frame': self.frame, 'rollbacks': self.rollbacks, 'resimulated': self.resimulated,
+                'max_depth': self.max_depth, 'stalls': self.stalls, 'desyncs': self.desyncs,
+                'crc_checks': self.checked}
+
+# --- ПРОВЕРКА ЧЕРЕЗ LOOPBACK ---
+def run_peer(index, port, peer_port, ticks, latency, loss, seed=1234):
+    """Безоконный пир со случайным ботом; печатает JSON с CRC итогового состояния"""
+    from simulation import Simulation, LevelPrefetcher, PLAYER_SIZES, PLAYER_START_X, Player
+
+    levels = []
+    def make_sim(level_seed):
+        levels.append(LevelPrefetcher(seed=level_seed))
+        return Simulation([Player(x, size) for x, size in zip(PLAYER_START_X, PLAYER_SIZES)], levels=levels[0])
+
+    transport = LossyTransport(UdpTransport(port, ("127.0.0.1", peer_port), "127.0.0.1"),
+                               latency, latency / 5, loss, random.Random(index))
+    session = RollbackSession(make_sim, index, transport, seed=seed if index == 0 else None)
+    bot = random.Random(100 + index)
+    bits = INPUT_RIGHT
+    dt = 1 / TICK_RATE
+    next_tick = time.perf_counter()
+    worst = 0.0
+    deadline = time.perf_counter() + ticks * dt + 20
+    while not session.synced(ticks) and time.perf_counter() < deadline:
+        if session.frame < ticks:
+            if bot.random() < 0.05:
+                bits = bot.choice([INPUT_RIGHT, INPUT_RIGHT, INPUT_LEFT, 0])
+            start = time.perf_counter()
+            session.advance(bits | (INPUT_JUMP if bot.random() < 0.08 else 0))
+            worst = max(worst, time.perf_counter() - start)
+        else:
+            session.finish()
+        next_tick += dt
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+    # Последние пакеты с подтверждением могли потеряться - шлем еще немного
+    linger = time.perf_counter() + 0.5
+    while time.perf_counter() < linger:
+        session.finish()
+        time.sleep(dt)
+    session.finish()
+    result = session.stats()
+    result.update(player=index, synced=session.synced(ticks), crc=zlib.crc32(session.sim.snapshot()),
+                  worst_tick_ms=round(worst * 1000, 3))
+    print(json.dumps(result))
+    for source in levels:
+        source.close()
+    transport.close()
+
+def run_test(ticks=600, latency_ms=80, loss=0.1, ports=(47001, 47002)):
+    args = [str(ticks), str(latency_ms / 1000), str(loss)]
+    procs = [subprocess.Popen([sys.executable, __file__, "--peer", str(i), str(ports[i]), str(ports[1 - i]), *args],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+             for i in range(2)]
+    results = []
+    for proc in procs:
+        out, _ = proc.communicate(timeout=ticks / TICK_RATE + 60)
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    for r in results:
+        print(r)
+    ok = all(r['synced'] and r['desyncs'] == 0 for r in results) and results[0]['crc'] == results[1]['crc']
+    print(f"{ticks} ticks, {latency_ms} ms one-way latency, {loss:.0%} loss: "
+          f"{'states match' if ok else 'DESYNC'} (crc {results[0]['crc']:08x} / {results[1]['crc']:08x})")
+    return 0 if ok else 1
+
+if __name__ == "__main__" and "--peer" in sys.argv:
+    i = sys.argv.index("--peer")
+    index, port, peer_port, ticks = (int(a) for a in sys.argv[i + 1:i + 5])
+    latency, loss = float(sys.argv[i + 5]), float(sys.argv[i + 6])
+    run_peer(index, port, peer_port, ticks, latency, loss)
+
+elif __name__ == "__main__" and "--test" in sys.argv:
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    ticks = int(args[0]) if args else 600
+    latency_ms = int(args[1]) if len(args) > 1 else 80
+    loss = float(args[2]) if len(args) > 2 else 0.1
+    sys.exit(run_test(ticks, latency_ms, loss))
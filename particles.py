@@ -0,0 +1,195 @@
+"""Частицы окружения в массивах NumPy: пузыри лавы и облака.
+
+Вместо списков словарей - struct-of-arrays: координаты, скорости и размеры
+лежат в отдельных массивах, обновление идет одной векторной операцией, а
+отжившие частицы удаляются сжатием по маске.
+"""
+import numpy as np
+import pygame
+
+from simulation import SCREEN_WIDTH, SCREEN_HEIGHT, GROUND_Y
+
+COLOR_LAVA_BUBBLE = (255, 200, 80)
+COLOR_CLOUD_EDGE = (230, 240, 255)
+COLOR_CLOUD = (255, 255, 255)
+COLOR_CLOUD_KEY = (255, 0, 255)  # прозрачный фон спрайта облака
+
+# --- ЛАВА ---
+class LavaParticles:
+    """Пузыри лавы: всплывают со дна экрана и исчезают у поверхности"""
+    def __init__(self, capacity=20, spawn_rate=1, rng=None):
+        self.capacity = capacity
+        self.spawn_rate = spawn_rate
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.speed = np.zeros(capacity, dtype=np.float32)
+        self.sprites = {}
+
+    def set_capacity(self, capacity):
+        """Меняет лимит частиц; лишние живые частицы отбрасываются"""
+        n = min(self.count, capacity)
+        for name in ('x', 'y', 'size', 'speed'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+        self.capacity = capacity
+        self.count = n
+
+    def spawn(self, n):
+        n = min(n, self.capacity - self.count)
+        if n <= 0:
+            return
+        i, j = self.count, self.count + n
+        self.x[i:j] = self.rng.integers(0, SCREEN_WIDTH + 1, n)
+        self.y[i:j] = SCREEN_HEIGHT
+        self.size[i:j] = self.rng.integers(2, 7, n)
+        self.speed[i:j] = self.rng.uniform(1.5, 3, n)
+        self.count = j
+
+    def update(self):
+        self.spawn(self.spawn_rate)
+
+        n = self.count
+        self.y[:n] -= self.speed[:n]
+
+        # Сжатие по маске: живые частицы сдвигаются в начало массивов
+        alive = self.y[:n] >= GROUND_Y
+        k = int(np.count_nonzero(alive))
+        if k < n:
+            for arr in (self.x, self.y, self.size, self.speed):
+                arr[:k] = arr[:n][alive]
+            self.count = k
+
+    def bubble_sprite(self, size):
+        # Круг каждого размера рисуется один раз, дальше только blit
+        img = self.sprites.get(size)
+        if img is None:
+            img = pygame.Surface((size * 2 + 1, size * 2 + 1), pygame.SRCALPHA)
+            pygame.draw.circle(img, COLOR_LAVA_BUBBLE, (size, size), size)
+            self.sprites[size] = img
+        return img
+
+    def draw(self, surface, scale=1.0):
+        n = self.count
+        if not n:
+            return
+        size = self.size[:n]
+        x = self.x[:n]
+        y = self.y[:n].astype(np.int32)
+        if scale != 1.0:
+            # Пониженное разрешение кадра: координаты и радиусы в его пикселях
+            size = np.maximum(1, (size * scale).astype(np.int32))
+            x = (x * scale).astype(np.int32)
+            y = (y * scale).astype(np.int32)
+        xs = (x - size).tolist()
+        ys = (y - size).tolist()
+        sprite = self.bubble_sprite
+        surface.blits([(sprite(s), (x, y)) for s, x, y in zip(size.tolist(), xs, ys)], False)
+
+# --- ОБЛАКА ---
+class CloudField:
+    """Облака: по строке на облако, части (круги) - в матрицах (облако, часть).
+
+    Форма облака меняется только в reset, поэтому круги рисуются один раз в
+    спрайт облака (с colorkey), а кадр - это blit спрайта на облако.
+    """
+    MAX_PARTS = 7
+    # Детализация: (кайма, частей на облако); уровень 2 - полная
+    DETAIL = {2: (True, MAX_PARTS), 1: (False, MAX_PARTS), 0: (False, 3)}
+
+    def __init__(self, count=5, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = count
+        self.detail = 2
+        self.x = np.zeros(count, dtype=np.float32)
+        self.y = np.zeros(count, dtype=np.int32)
+        self.speed = np.zeros(count, dtype=np.float32)
+        self.dx = np.zeros((count, self.MAX_PARTS), dtype=np.int32)
+        self.dy = np.zeros((count, self.MAX_PARTS), dtype=np.int32)
+        self.r = np.zeros((count, self.MAX_PARTS), dtype=np.int32)
+        # Спрайты облаков: масштаб -> (поверхность, смещение x, смещение y)
+        self.sprites = [{} for _ in range(count)]
+        self.sprites_detail = self.detail
+        # Пустые части облака имеют радиус 0 и не рисуются
+        self.reset(np.arange(count), random_x=True)
+
+    def reset(self, idx, random_x=False):
+        n = len(idx)
+        if not n:
+            return
+        rng = self.rng
+        self.x[idx] = rng.integers(0, SCREEN_WIDTH + 1, n) if random_x else -200
+        self.y[idx] = rng.integers(20, 201, n)
+        self.speed[idx] = rng.uniform(0.2, 0.5, n)
+        parts = rng.integers(4, self.MAX_PARTS + 1, n)
+        used = np.arange(self.MAX_PARTS) < parts[:, None]
+        self.dx[idx] = rng.integers(0, 101, (n, self.MAX_PARTS))
+        self.dy[idx] = rng.integers(0, 31, (n, self.MAX_PARTS))
+        self.r[idx] = np.where(used, rng.integers(25, 46, (n, self.MAX_PARTS)), 0)
+        self.bake(idx)
+
+    def bake(self, idx=None):
+        """Запекает спрайты облаков (всех или idx) заново - после смены формы
+        или формата экрана; уменьшенные копии строятся при первой отрисовке"""
+        for i in (range(self.count) if idx is None else idx):
+            self.sprites[i] = {1.0: self.bake_cloud(i, 1.0)}
+
+    def bake_cloud(self, i, scale):
+        edge, parts = self.DETAIL[self.detail]
+        used = self.r[i] > 0
+        used[parts:] = False
+        dx, dy, r = self.dx[i][used], self.dy[i][used], self.r[i][used]
+        if scale != 1.0:
+            dx = (dx * scale).astype(np.int32)
+            dy = (dy * scale).astype(np.int32)
+            r = np.maximum(1, (r * scale).astype(np.int32))
+        border = max(1, int(2 * scale)) if edge else 0
+        left = int((dx - r - border).min())
+        top = int((dy - r - border).min())
+        img = pygame.Surface((int((dx + r + border).max()) - left + 1, int((dy + r + border).max()) - top + 1))
+        if pygame.display.get_surface() is not None:
+            img = img.convert()
+        img.fill(COLOR_CLOUD_KEY)
+        img.set_colorkey(COLOR_CLOUD_KEY, pygame.RLEACCEL)
+        # Тот же порядок кругов, что у прямой отрисовки: кайма каждой части поверх прошлых
+        for x, y, radius in zip((dx - left).tolist(), (dy - top).tolist(), r.tolist()):
+            if edge:
+                pygame.draw.circle(img, COLOR_CLOUD_EDGE, (x, y), radius + border)
+            pygame.draw.circle(img, COLOR_CLOUD, (x, y), radius)
+        return img, left, top
+
+    def sprite(self, i, scale):
+        if self.sprites_detail != self.detail:
+            # Сменилась детализация (качество) - старые спрайты не годятся
+            self.sprites_detail = self.detail
+            self.bake()
+        sprite = self.sprites[i].get(scale)
+        if sprite is None:
+            sprite = self.sprites[i][scale] = self.bake_cloud(i, scale)
+        return sprite
+
+    def update(self):
+        self.x += self.speed
+        self.reset(np.flatnonzero(self.x > SCREEN_WIDTH + 100))
+
+    def bounds(self):
+        """Прямоугольники облаков на экране - для грязных областей"""
+        rects = []
+        for i, (x, y) in enumerate(zip(self.x.astype(np.int32).tolist(), self.y.tolist())):
+            img, left, top = self.sprite(i, 1.0)
+            rects.append(img.get_rect(topleft=(x + left, y + top)))
+        return rects
+
+    def draw(self, surface, idx=None, scale=1.0):
+        """Рисует облака (или только облака с номерами idx) с текущей детализацией"""
+        xs = self.x.astype(np.int32).tolist()
+        ys = self.y.tolist()
+        blits = []
+        for i in (range(self.count) if idx is None else idx):
+            img, left, top = self.sprite(i, scale)
+            blits.append((img, (int(xs[i] * scale) + left, int(ys[i] * scale) + top)))
+        surface.blits(blits, False)
@@ -0,0 +1,139 @@
+"""Покадровый профайлер главного цикла: таймеры подсистем, оверлей и экспорт.
+
+Таймер - это `with profiler.section("name"):` вокруг вызова. Секция может
+выполняться несколько раз за кадр (тики фиксированного шага), время
+суммируется. Для оверлея храним скользящее окно, для экспорта - журнал
+кадров: CSV (кадр на строку) и Chrome trace JSON (chrome://tracing, Perfetto).
+"""
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+from textcache import text_cache
+
+FRAME_BUDGET_MS = 1000 / 60
+
+class Section:
+    """Таймер одной подсистемы; объект переиспользуется, чтобы не мусорить"""
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler.add(self.name, self.start, end)
+        return False
+
+class FrameProfiler:
+    def __init__(self, window=240, max_frames=18000):
+        self.window = window
+        self.sections = {}   # имя -> Section
+        self.history = {}    # имя -> deque мс за кадр (скользящее окно)
+        self.frame_ms = deque(maxlen=window)
+        self.frames = deque(maxlen=max_frames)  # журнал для экспорта
+        self.current = {}
+        self.spans = []
+        self.frame_start = 0.0
+        self.frame_index = 0
+        self.epoch = time.perf_counter()
+
+    def section(self, name):
+        sec = self.sections.get(name)
+        if sec is None:
+            sec = self.sections[name] = Section(self, name)
+            self.history[name] = deque(maxlen=self.window)
+        return sec
+
+    def add(self, name, start, end):
+        self.current[name] = self.current.get(name, 0.0) + (end - start) * 1000
+        self.spans.append((name, start, end))
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        self.current = {}
+        self.spans = []
+
+    def end_frame(self):
+        end = time.perf_counter()
+        total = (end - self.frame_start) * 1000
+        self.frame_ms.append(total)
+        for name, hist in self.history.items():
+            hist.append(self.current.get(name, 0.0))
+        self.frames.append((self.frame_index, self.frame_start, end, self.current, self.spans))
+        self.frame_index += 1
+
+    # --- СТАТИСТИКА ---
+    @staticmethod
+    def summarize(values):
+        """(среднее, p95, p99) по окну в мс"""
+        if not values:
+            return 0.0, 0.0, 0.0
+        ordered = sorted(values)
+        n = len(ordered)
+        return (sum(ordered) / n,
+                ordered[min(n - 1, int(n * 0.95))],
+                ordered[min(n - 1, int(n * 0.99))])
+
+    def stats(self):
+        """[(имя, среднее, p95, p99)], первой строкой - весь кадр"""
+        rows = [("frame", *self.summarize(self.frame_ms))]
+        for name, hist in self.history.items():
+            rows.append((name, *self.summarize(hist)))
+        return rows
+
+    # --- ОВЕРЛЕЙ ---
+    def draw_overlay(self, surface, font, x, y, graph_h=60):
+        color = (255, 255, 0)
+        text_cache.draw(surface, font, "section        avg    p95    p99 ms", color, (x, y))
+        y += 18
+        for name, avg, p95, p99 in self.stats():
+            text_cache.draw(surface, font, f"{name:<12}{avg:>7.2f}{p95:>7.2f}{p99:>7.2f}", color, (x, y))
+            y += 18
+
+        # График времени кадра; линия - бюджет 60 FPS
+        width = self.window
+        box = pygame.Rect(x, y + 4, width, graph_h)
+        pygame.draw.rect(surface, (0, 0, 0), box)
+        scale = graph_h / (FRAME_BUDGET_MS * 2)
+        budget_y = box.bottom - int(FRAME_BUDGET_MS * scale)
+        pygame.draw.line(surface, (255, 80, 80), (box.left, budget_y), (box.right - 1, budget_y))
+        if len(self.frame_ms) > 1:
+            points = [(box.left + i, box.bottom - 1 - min(graph_h - 1, int(ms * scale)))
+                      for i, ms in enumerate(self.frame_ms)]
+            pygame.draw.lines(surface, (0, 255, 0), False, points)
+        pygame.draw.rect(surface, (255, 255, 255), box, 1)
+
+    # --- ЭКСПОРТ ---
+    def export_csv(self, path):
+        names = list(self.history)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "start_ms", "frame_ms", *names])
+            for index, start, end, times, _ in self.frames:
+                writer.writerow([index, f"{(start - self.epoch) * 1000:.3f}", f"{(end - start) * 1000:.3f}",
+                                 *(f"{times.get(name, 0.0):.3f}" for name in names)])
+
+    def export_chrome_trace(self, path):
+        def us(t):
+            return round((t - self.epoch) * 1e6, 1)
+        events = []
+        for index, start, end, _, spans in self.frames:
+            events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": us(start), "dur": round((end - start) * 1e6, 1), "args": {"frame": index}})
+            for name, s, e in spans:
+                events.append({"name": name, "ph": "X", "pid": 1, "tid": 1,
+                               "ts": us(s), "dur": round((e - s) * 1e6, 1)})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+profiler = FrameProfiler()
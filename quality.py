@@ -0,0 +1,128 @@
+"""Адаптивное качество графики по бюджету кадра (16.6 мс при 60 FPS).
+
+Губернатор смотрит на время работы кадра (profiler.frame_ms, без сна в
+clock.tick) и переключает уровни QUALITY_LEVELS: лимит пузырей лавы,
+детализация облаков, кирпичи или заливка платформ, слои параллакса,
+внутреннее разрешение кадра. Вниз - когда медиана за короткое окно выше
+DOWN_AT бюджета, вверх - только когда даже p95 за длинное окно ниже UP_AT
+бюджета. Разные пороги и окна плюс пауза после переключения - гистерезис:
+качество не дребезжит на границе бюджета. Если после подъема почти сразу
+пришлось опуститься, следующий подъем ждет вдвое дольше.
+"""
+from bisect import insort, bisect_left
+from itertools import islice
+from collections import deque
+
+from profiler import FRAME_BUDGET_MS
+
+# particles - лимит пузырей лавы, cloud_detail - CloudField.DETAIL,
+# bricks - кирпичный узор или заливка, parallax - слои фона за платформами,
+# render_scale - разрешение кадра
+QUALITY_LEVELS = [
+    {'name': 'high', 'particles': 20, 'cloud_detail': 2, 'bricks': True, 'parallax': True, 'render_scale': 1.0},
+    {'name': 'medium', 'particles': 10, 'cloud_detail': 1, 'bricks': True, 'parallax': True, 'render_scale': 1.0},
+    {'name': 'low', 'particles': 5, 'cloud_detail': 0, 'bricks': False, 'parallax': False, 'render_scale': 1.0},
+    {'name': 'lowest', 'particles': 0, 'cloud_detail': 0, 'bricks': False, 'parallax': False, 'render_scale': 0.5},
+]
+
+def full_resolution_levels(levels=QUALITY_LEVELS):
+    """Уровни для вывода без масштабирования кадра (DirtyRenderer рисует в полном разрешении).
+
+    render_scale у всех 1; уровень, который отличался от предыдущего только
+    масштабом, выпадает, чтобы губернатор не тратил на него шаг.
+    """
+    result = []
+    for q in levels:
+        q = dict(q, render_scale=1.0)
+        if result and all(q[k] == result[-1][k] for k in q if k != 'name'):
+            continue
+        result.append(q)
+    return result
+
+DOWN_AT = 0.9       # доля бюджета: медиана выше - качество вниз
+UP_AT = 0.6         # p95 ниже - качество вверх
+DOWN_WINDOW = 20    # кадров
+UP_WINDOW = 180
+MAX_UP_WINDOW = 1440
+COOLDOWN = 60       # кадров без решений после переключения
+
+class QualityGovernor:
+    def __init__(self, levels=QUALITY_LEVELS, budget_ms=FRAME_BUDGET_MS, on_change=None, level=0):
+        self.levels = levels
+        self.budget_ms = budget_ms
+        self.on_change = on_change   # вызывается с настройками нового уровня
+        self.level = level
+        self.enabled = True
+        self.up_window = UP_WINDOW
+        self.samples = deque(maxlen=MAX_UP_WINDOW)
+        # Последние up_window замеров по возрастанию: p95 без сортировки каждый кадр
+        self.window = []
+        self.cooldown = COOLDOWN     # первые кадры (прогрев кэшей) не считаем
+        self.frame = 0
+        self.last_up = None          # кадр последнего подъема
+        self.log = deque(maxlen=4)   # (кадр, с уровня, на уровень, мс) - для оверлея
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def update(self, frame_ms):
+        """Учитывает время кадра; True - уровень качества сменился"""
+        self.frame += 1
+        if not self.enabled:
+            return False
+        if self.cooldown:
+            self.cooldown -= 1
+            return False
+        samples = self.samples
+        window = self.window
+        if len(window) == self.up_window:
+            # Окно полное - из него выпадает самый старый замер окна
+            del window[bisect_left(window, samples[-self.up_window])]
+        samples.append(frame_ms)
+        insort(window, frame_ms)
+        n = len(samples)
+
+        if n >= DOWN_WINDOW and self.level < len(self.levels) - 1:
+            recent = sorted(islice(reversed(samples), DOWN_WINDOW))
+            median = recent[DOWN_WINDOW // 2]
+            if median > self.budget_ms * DOWN_AT:
+                # Подъем не удержался - следующий ждем дольше
+                if self.last_up is not None and self.frame - self.last_up < self.up_window:
+                    self.up_window = min(self.up_window * 2, MAX_UP_WINDOW)
+                self.set_level(self.level + 1, median)
+                return True
+
+        if len(window) >= self.up_window and self.level > 0:
+            p95 = window[int(len(window) * 0.95)]
+            if p95 < self.budget_ms * UP_AT:
+                self.last_up = self.frame
+                self.set_level(self.level - 1, p95)
+                return True
+        return False
+
+    def set_level(self, level, ms=None):
+        """Переключает уровень; ms - время кадра, из-за которого (None - вручную)"""
+        if ms is not None:
+            self.log.append((self.frame, self.level, level, ms))
+        self.level = level
+        self.samples.clear()
+        self.window.clear()
+        self.cooldown = COOLDOWN
+        if self.on_change is not None:
+            self.on_change(self.settings)
+
+    def describe(self):
+        """Строки для отладочного оверлея"""
+        q = self.settings
+        mode = "auto" if self.enabled else "fixed"
+        lines = [f"Quality: {q['name']} ({mode}, {self.level + 1}/{len(self.levels)}) | "
+                 f"particles={q['particles']} clouds={q['cloud_detail']} "
+                 f"bricks={'on' if q['bricks'] else 'flat'} parallax={'on' if q['parallax'] else 'off'} "
+                 f"scale={q['render_scale']:g} | "
+                 f"up after {self.up_window} frames"]
+        for frame, old, new, ms in reversed(self.log):
+            arrow = "down" if new > old else "up"
+            lines.append(f"  frame {frame}: {self.levels[old]['name']} -> {self.levels[new]['name']} "
+                         f"({arrow}, {ms:.1f} ms vs {self.budget_ms:.1f} budget)")
+        return lines
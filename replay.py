@@ -0,0 +1,150 @@
+"""Запись ввода сессии и воспроизведение без отрисовки на максимальной скорости.
+
+Запись - это сиды всех сыгранных уровней и байт ввода на игрока на тик
+(INPUT_LEFT | INPUT_RIGHT | INPUT_JUMP), блок ввода сжат zlib. Еще хранится
+CRC состояния игроков после каждого тика: воспроизведение сверяет его и
+сразу показывает, если физика разошлась с записанной сессией.
+
+    python movement.py --record session.rec [--seed 42]   # записать игру
+    python replay.py session.rec [--repeat N]              # прогнать запись
+"""
+import sys
+import time
+import zlib
+import struct
+
+from simulation import TICK_RATE, Player, Simulation, build_level
+
+MAGIC = b"BGRP"
+VERSION = 1
+# magic, версия, игроков, тиков/с, платформ в уровне, уровней, тиков, CRC
+HEADER = struct.Struct("<4sBBHIIII")
+PLAYER = struct.Struct("<iHH")   # start_x, ширина и высота хитбокса
+SEED = struct.Struct("<I")
+STATE = struct.Struct("<iidBb")  # x, y, vel_y, on_ground, coyote_timer
+
+def state_crc(crc, sim):
+    """Добавляет состояние игроков после тика к CRC сессии"""
+    for p in sim.players:
+        crc = zlib.crc32(STATE.pack(p.rect.x, p.rect.y, p.vel_y, p.on_ground, p.coyote_timer), crc)
+    return crc
+
+class InputLog:
+    """Записанная сессия: игроки, сиды уровней и ввод по тикам"""
+    def __init__(self, players, tick_rate=TICK_RATE):
+        self.players = players            # [(start_x, (w, h))]
+        self.tick_rate = tick_rate
+        self.platform_count = 0
+        self.level_seeds = []
+        self.inputs = bytearray()         # тик за тиком, байт на игрока
+        self.crc = 0
+
+    @property
+    def ticks(self):
+        return len(self.inputs) // len(self.players)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.players), self.tick_rate, self.platform_count,
+                                len(self.level_seeds), self.ticks, self.crc))
+            for start_x, (w, h) in self.players:
+                f.write(PLAYER.pack(start_x, w, h))
+            for seed in self.level_seeds:
+                f.write(SEED.pack(seed))
+            f.write(zlib.compress(bytes(self.inputs), 9))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, n_players, tick_rate, platform_count, n_levels, n_ticks, crc = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: не файл записи или другая версия формата")
+        offset = HEADER.size
+        players = []
+        for _ in range(n_players):
+            start_x, w, h = PLAYER.unpack_from(data, offset)
+            players.append((start_x, (w, h)))
+            offset += PLAYER.size
+        log = cls(players, tick_rate)
+        log.platform_count = platform_count
+        for _ in range(n_levels):
+            log.level_seeds.append(SEED.unpack_from(data, offset)[0])
+            offset += SEED.size
+        log.inputs = bytearray(zlib.decompress(data[offset:]))
+        log.crc = crc
+        if log.ticks != n_ticks:
+            raise ValueError(f"{path}: обрезанный лог ввода")
+        return log
+
+class InputRecorder:
+    """Подключается к Simulation (sim.recorder) и пишет ввод каждого тика"""
+    def __init__(self, sim):
+        self.log = InputLog([(p.start_x, p.rect.size) for p in sim.players])
+        sim.recorder = self
+
+    def level_started(self, level):
+        if level.seed is None:
+            raise ValueError("уровень без seed нельзя воспроизвести")
+        self.log.level_seeds.append(level.seed)
+        self.log.platform_count = level.platform_count
+
+    def record(self, bits):
+        self.log.inputs.extend(bits)
+
+    def tick_done(self, sim):
+        self.log.crc = state_crc(self.log.crc, sim)
+
+class ReplayLevels:
+    """Источник уровней для Simulation: строит записанные уровни по сидам по порядку"""
+    def __init__(self, log):
+        self.log = log
+
+    def take(self, index):
+        return build_level(self.log.level_seeds[index], self.log.platform_count)
+
+def replay(log, on_tick=None):
+    """Прогоняет запись без отрисовки и ограничения FPS.
+
+    Возвращает (симуляция, CRC прогона, побед). После победы следующий
+    уровень ставится сразу, как будто игроки нажали "НОВЫЙ УРОВЕНЬ".
+    """
+    players = [Player(start_x, size) for start_x, size in log.players]
+    sim = Simulation(players, levels=ReplayLevels(log))
+    n = len(players)
+    inputs = log.inputs
+    crc = 0
+    wins = 0
+    for t in range(log.ticks):
+        if sim.won:
+            wins += 1
+            sim.new_level()
+        base = t * n
+        for i, p in enumerate(players):
+            p.apply_input(inputs[base + i])
+        sim.step()
+        crc = state_crc(crc, sim)
+        if on_tick is not None:
+            on_tick(sim)
+    if sim.won:
+        wins += 1
+    return sim, crc, wins
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python replay.py session.rec [--repeat N]")
+        sys.exit(2)
+    log = InputLog.load(sys.argv[1])
+    repeat = int(sys.argv[sys.argv.index("--repeat") + 1]) if "--repeat" in sys.argv else 1
+    start = time.perf_counter()
+    for _ in range(repeat):
+        sim, crc, wins = replay(log)
+    elapsed = time.perf_counter() - start
+    ticks = log.ticks * repeat
+    print(f"{log.ticks} ticks ({log.ticks / log.tick_rate:.1f} s of play), {len(log.level_seeds)} levels, "
+          f"wins: {wins}, deaths: {sim.deaths}")
+    print(f"replayed at {ticks / elapsed:.0f} ticks/s (x{ticks / elapsed / log.tick_rate:.0f} real time)")
+    if crc != log.crc:
+        print(f"STATE MISMATCH: recorded crc {log.crc:08x}, replay crc {crc:08x}")
+        sys.exit(1)
+    print(f"state crc {crc:08x} matches the recording")
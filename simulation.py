@@ -0,0 +1,1030 @@
+"""Логика игры без отрисовки: физика игроков, генерация уровня, лава и победа.
+
+Модуль не открывает окно и не требует SDL video (pygame.Rect работает без
+pygame.init()), поэтому симуляцию можно гонять без дисплея и без ограничения
+FPS: для автотестов прохождения, проверки уровней и регрессий.
+"""
+import sys
+import time
+import math
+import random
+import struct
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+# --- КОНСТАНТЫ ---
+SCREEN_WIDTH = 1000
+SCREEN_HEIGHT = 600
+
+# Физика
+GRAVITY = 0.8
+JUMP_FORCE = -16  # Немного меньше для проходимости
+MOVE_SPEED = 6
+MAX_FALL_SPEED = 15
+COYOTE_TICKS = 6  # Сколько тиков после схода с края еще можно прыгнуть
+LAND_TOLERANCE = 8  # Насколько хитбокс может "провалиться" в платформу и все же встать на нее
+CHAR_SCALE = 0.18
+GROUND_Y = SCREEN_HEIGHT - 60
+
+# Фиксированный шаг: все константы выше подобраны под 60 тиков в секунду
+TICK_RATE = 60
+MAX_SUBSTEPS = 5  # Сколько тиков максимум догоняем за один кадр
+
+# Хитбоксы по умолчанию - размеры стоящих спрайтов при CHAR_SCALE
+# (окно передает реальные размеры загруженных спрайтов)
+PLAYER_SIZES = [(66, 108), (53, 108)]
+PLAYER_START_X = [100, 200]
+
+# Биты ввода игрока на тик (запись и воспроизведение сессий)
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+
+# Снимок состояния партии: заголовок симуляции и по блоку на игрока.
+# Уровень задается seed и platform_count (0 - бесконечный) и строится заново;
+# seeded = 0 - у уровня seed нет (из файла), и seed с platform_count не значат ничего
+SIM_STATE = "ddIIBIBII"   # camera_x, prev_camera_x, tick, deaths, won, номер уровня, seeded, seed, platform_count
+PLAYER_STATE = "iiiiidIbB"  # x, y, prev_x, prev_y, vel_x, vel_y, anim_timer, coyote_timer, флаги
+SIM_FIELDS = ('camera_x', 'prev_camera_x', 'tick', 'deaths', 'won', 'level_index',
+              'level_seeded', 'level_seed', 'platform_count')
+PLAYER_FIELDS = ('x', 'y', 'prev_x', 'prev_y', 'vel_x', 'vel_y', 'anim_timer', 'coyote_timer', 'flags')
+
+# --- ИНДЕКС ПЛАТФОРМ ---
+class PlatformIndex:
+    """Платформы, отсортированные по левому краю: выборка полосы по x через bisect"""
+    def __init__(self, rects=()):
+        self.rects = []
+        self.lefts = []
+        self.max_width = 0
+        for r in rects:
+            self.add(r)
+
+    def add(self, rect):
+        # Генератор идет слева направо, поэтому обычно это просто append
+        if not self.lefts or rect.left >= self.lefts[-1]:
+            self.rects.append(rect)
+            self.lefts.append(rect.left)
+        else:
+            i = bisect_right(self.lefts, rect.left)
+            self.rects.insert(i, rect)
+            self.lefts.insert(i, rect.left)
+        self.max_width = max(self.max_width, rect.width)
+
+    def query(self, x0, x1):
+        """Платформы, пересекающие полосу x0 <= x < x1"""
+        lo = bisect_left(self.lefts, x0 - self.max_width)
+        hi = bisect_left(self.lefts, x1)
+        return [r for r in self.rects[lo:hi] if r.right > x0]
+
+    def drop_before(self, x):
+        """Удаляет платформы левее x (правый край < x); возвращает сколько удалено.
+
+        Берется только префикс с left < x - max_width: такие платформы
+        гарантированно кончаются до x, а остальные уйдут следующими вызовами.
+        """
+        k = bisect_left(self.lefts, x - self.max_width)
+        if k:
+            del self.rects[:k]
+            del self.lefts[:k]
+        return k
+
+    def __iter__(self):
+        return iter(self.rects)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __getitem__(self, i):
+        return self.rects[i]
+
+class PackedPlatformIndex:
+    """Тот же индекс поверх упакованного int32-буфера (x, y, w, h подряд).
+
+    Буфер обычно - отображенный в память файл уровня (levelfile.py), уже
+    отсортированный по левому краю. bisect идет прямо по срезу буфера с
+    шагом 4, а pygame.Rect создаются только для платформ из выборки (и
+    держатся в небольшом кэше - рядом с игроками одни и те же), так что
+    открытие уровня не зависит от числа платформ.
+    """
+    CACHE_SIZE = 1024
+
+    def __init__(self, data, max_width):
+        self.data = data           # memoryview формата 'i'
+        self.lefts = data[0::4]
+        self.max_width = max_width
+        self.cache = {}            # номер -> Rect
+
+    def rect(self, i):
+        r = self.cache.get(i)
+        if r is None:
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.clear()
+            d = self.data
+            k = i * 4
+            r = self.cache[i] = pygame.Rect(d[k], d[k + 1], d[k + 2], d[k + 3])
+        return r
+
+    def query(self, x0, x1):
+        """Платформы, пересекающие полосу x0 <= x < x1"""
+        lo = bisect_left(self.lefts, x0 - self.max_width)
+        hi = bisect_left(self.lefts, x1)
+        rect = self.rect
+        return [r for r in map(rect, range(lo, hi)) if r.right > x0]
+
+    @property
+    def rects(self):
+        """Все платформы списком Rect - только для небольших уровней"""
+        return list(self)
+
+    def __iter__(self):
+        # Полный обход (сохранение, проверка уровня) идет мимо кэша
+        d = self.data
+        return (pygame.Rect(d[k], d[k + 1], d[k + 2], d[k + 3]) for k in range(0, len(d), 4))
+
+    def __len__(self):
+        return len(self.lefts)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.lefts)
+        if not 0 <= i < len(self.lefts):
+            raise IndexError("platform index out of range")
+        return self.rect(i)
+
+# --- ИГРОК ---
+def sweep_aabb(x, y, w, h, dx, dy, r):
+    """Первое касание прямоугольника (x, y, w, h), сдвигаемого на (dx, dy), с платформой r.
+
+    Возвращает (t, ось): доля смещения до удара (0..1) и ось нормали ('x' -
+    бок платформы, 'y' - верх или низ), или None, если касания нет. Если
+    прямоугольник уже влез в платформу, засчитывается только приземление в
+    пределах LAND_TOLERANCE, как в дискретной проверке.
+    """
+    if dx > 0:
+        x_entry = (r.left - x - w) / dx
+        x_exit = (r.right - x) / dx
+    elif dx < 0:
+        x_entry = (r.right - x) / dx
+        x_exit = (r.left - x - w) / dx
+    elif x + w <= r.left or x >= r.right:
+        return None
+    else:
+        x_entry, x_exit = -math.inf, math.inf
+    if dy > 0:
+        y_entry = (r.top - y - h) / dy
+        y_exit = (r.bottom - y) / dy
+    elif dy < 0:
+        y_entry = (r.bottom - y) / dy
+        y_exit = (r.top - y - h) / dy
+    elif y + h <= r.top or y >= r.bottom:
+        return None
+    else:
+        y_entry, y_exit = -math.inf, math.inf
+
+    entry = max(x_entry, y_entry)
+    if entry >= min(x_exit, y_exit) or entry >= 1 or min(x_exit, y_exit) <= 0:
+        return None
+    if entry < 0:
+        if dy > 0 and y + h <= r.top + LAND_TOLERANCE:
+            return 0.0, 'y'
+        return None
+    return entry, ('x' if x_entry > y_entry else 'y')
+
+class Player:
+    """Физическое состояние игрока: хитбокс, скорости и флаги управления"""
+    __slots__ = ('start_x', 'keys', 'rect', 'moving_left', 'moving_right', 'prev_x', 'prev_y',
+                 'vel_x', 'vel_y', 'on_ground', 'is_jumping', 'look_right', 'anim_timer',
+                 'coyote_timer', 'was_moving', 'was_on_ground', 'jump_pressed')
+
+    def __init__(self, x, size=PLAYER_SIZES[0], keys_map=None):
+        self.start_x = x
+        self.keys = keys_map
+        self.rect = pygame.Rect(0, 0, size[0], size[1])
+
+        # СОБЫТИЙНАЯ МОДЕЛЬ: флаги вместо get_pressed()
+        self.moving_left = False
+        self.moving_right = False
+
+        self.reset(0)
+
+    def reset(self, y_pos, x=None):
+        self.rect.x = self.start_x if x is None else x
+        self.rect.bottom = y_pos
+        # Позиция на прошлом тике - для интерполяции при отрисовке
+        self.prev_x = self.rect.x
+        self.prev_y = self.rect.y
+        self.vel_y = 0
+        self.vel_x = 0
+        self.on_ground = False
+        self.is_jumping = False
+        self.look_right = True
+        self.anim_timer = 0
+        self.coyote_timer = 0
+        self.was_moving = False
+        self.was_on_ground = True
+        # Сбрасываем флаги движения
+        self.moving_left = False
+        self.moving_right = False
+        self.jump_pressed = False
+
+    def update(self, platforms):
+        # Кандидаты на столкновение - только платформы рядом с игроком.
+        # За кадр игрок сдвигается по x не больше чем на MOVE_SPEED
+        near = platforms.query(self.rect.left - MOVE_SPEED - 1, self.rect.right + MOVE_SPEED + 1)
+        self.prev_x = self.rect.x
+        self.prev_y = self.rect.y
+
+        # СОБЫТИЙНАЯ МОДЕЛЬ: используем флаги вместо get_pressed()
+        moving = False
+        self.vel_x = 0
+
+        # Проверяем флаги движения
+        if self.moving_left:
+            self.vel_x = -MOVE_SPEED
+            self.look_right = False
+            moving = True
+        if self.moving_right:
+            self.vel_x = MOVE_SPEED
+            self.look_right = True
+            moving = True
+
+        # Применяем горизонтальное движение
+        self.rect.x += self.vel_x
+
+        # Горизонтальные коллизии
+        for p in near:
+            if self.rect.colliderect(p):
+                if self.vel_x > 0:
+                    self.rect.right = p.left
+                elif self.vel_x < 0:
+                    self.rect.left = p.right
+
+        # Гравитация
+        self.vel_y += GRAVITY
+        self.vel_y = min(self.vel_y, MAX_FALL_SPEED)
+
+        # Применяем вертикальное движение
+        old_y = self.rect.y
+        self.rect.y += self.vel_y
+
+        # Вертикальные коллизии
+        self.was_on_ground = self.on_ground
+        self.on_ground = False
+
+        for p in near:
+            if self.rect.colliderect(p):
+                # Приземление на платформу
+                if self.vel_y > 0 and old_y + self.rect.height <= p.top + LAND_TOLERANCE:
+                    self.rect.bottom = p.top
+                    self.vel_y = 0
+                    self.on_ground = True
+                    self.is_jumping = False
+                    self.coyote_timer = COYOTE_TICKS
+
+                # Удар головой
+                elif self.vel_y < 0 and old_y >= p.bottom - LAND_TOLERANCE:
+                    self.rect.top = p.bottom
+                    self.vel_y = 0
+
+        # Coyote time
+        if not self.on_ground and self.was_on_ground:
+            self.coyote_timer = COYOTE_TICKS
+        elif not self.on_ground and self.coyote_timer > 0:
+            self.coyote_timer -= 1
+
+        # Анимация бега идет только при движении по земле
+        if moving and self.on_ground:
+            self.anim_timer += 1
+
+        self.was_moving = moving
+        return moving
+
+    def update_swept(self, platforms, dt=1):
+        """Шаг на dt тиков со сплошной (swept) проверкой коллизий.
+
+        update двигает хитбокс сразу на все смещение и разбирает перекрытия
+        colliderect: при скорости больше толщины платформы или большом шаге
+        игрок ее пролетает. Здесь смещение идет до первого касания (sweep_aabb
+        по всем кандидатам), скорость вдоль нормали гасится, остаток скользит
+        вдоль платформы. Гравитация копится потиково, поэтому без столкновений
+        шаг на dt тиков дает то же смещение, что dt шагов по тику.
+        """
+        rect = self.rect
+        self.prev_x = rect.x
+        self.prev_y = rect.y
+
+        moving = False
+        self.vel_x = 0
+        if self.moving_left:
+            self.vel_x = -MOVE_SPEED
+            self.look_right = False
+            moving = True
+        if self.moving_right:
+            self.vel_x = MOVE_SPEED
+            self.look_right = True
+            moving = True
+
+        dx = self.vel_x * dt
+        dy = 0.0
+        for _ in range(dt):
+            self.vel_y = min(self.vel_y + GRAVITY, MAX_FALL_SPEED)
+            dy += self.vel_y
+
+        x, y, w, h = rect
+        near = platforms.query(min(x, x + dx) - 1, max(x, x + dx) + w + 1)
+        self.was_on_ground = self.on_ground
+        self.on_ground = False
+
+        # Удар, гашение скорости по нормали, скольжение остатком (пол, потом стена)
+        for _ in range(3):
+            t, axis, hit = 1.0, None, None
+            for p in near:
+                contact = sweep_aabb(x, y, w, h, dx, dy, p)
+                if contact is not None and contact[0] < t:
+                    (t, axis), hit = contact, p
+            if hit is None:
+                x += dx
+                y += dy
+                break
+            x += dx * t
+            y += dy * t
+            dx *= 1 - t
+            dy *= 1 - t
+            if axis == 'x':
+                x = hit.left - w if dx > 0 else hit.right
+                dx = 0
+            elif dy > 0:
+                # Приземление на платформу
+                y = hit.top - h
+                dy = 0
+                self.vel_y = 0
+                self.on_ground = True
+                self.is_jumping = False
+                self.coyote_timer = COYOTE_TICKS
+            else:
+                # Удар головой
+                y = hit.bottom
+                dy = 0
+                self.vel_y = 0
+        rect.x = x
+        rect.y = y
+
+        # Coyote time (в тиках)
+        if not self.on_ground and self.was_on_ground:
+            self.coyote_timer = COYOTE_TICKS
+        elif not self.on_ground and self.coyote_timer > 0:
+            self.coyote_timer = max(0, self.coyote_timer - dt)
+
+        if moving and self.on_ground:
+            self.anim_timer += dt
+
+        self.was_moving = moving
+        return moving
+
+    def try_jump(self):
+        # Попытку запоминаем даже неудачную - она попадает в запись ввода
+        self.jump_pressed = True
+        if self.on_ground or self.coyote_timer > 0:
+            self.vel_y = JUMP_FORCE
+            self.is_jumping = True
+            self.on_ground = False
+            self.coyote_timer = 0
+
+    def input_bits(self):
+        """Ввод к текущему тику: флаги движения и был ли прыжок с прошлого тика"""
+        return ((INPUT_LEFT if self.moving_left else 0) |
+                (INPUT_RIGHT if self.moving_right else 0) |
+                (INPUT_JUMP if self.jump_pressed else 0))
+
+    def apply_input(self, bits):
+        """Тот же ввод, что дают события клавиатуры: флаги и try_jump"""
+        self.moving_left = bool(bits & INPUT_LEFT)
+        self.moving_right = bool(bits & INPUT_RIGHT)
+        if bits & INPUT_JUMP:
+            self.try_jump()
+
+    def get_state(self):
+        """Все изменяемое состояние игрока кортежем под PLAYER_STATE"""
+        flags = (self.moving_left | self.moving_right << 1 | self.on_ground << 2 |
+                 self.is_jumping << 3 | self.look_right << 4 | self.was_moving << 5 |
+                 self.was_on_ground << 6 | self.jump_pressed << 7)
+        return (self.rect.x, self.rect.y, self.prev_x, self.prev_y, self.vel_x, self.vel_y,
+                self.anim_timer, self.coyote_timer, flags)
+
+    def set_state(self, state):
+        self.rect.x, self.rect.y, self.prev_x, self.prev_y, self.vel_x, self.vel_y, \
+            self.anim_timer, self.coyote_timer, flags = state
+        self.moving_left = bool(flags & 1)
+        self.moving_right = bool(flags & 2)
+        self.on_ground = bool(flags & 4)
+        self.is_jumping = bool(flags & 8)
+        self.look_right = bool(flags & 16)
+        self.was_moving = bool(flags & 32)
+        self.was_on_ground = bool(flags & 64)
+        self.jump_pressed = bool(flags & 128)
+
+    def lerp_pos(self, alpha):
+        """Позиция между прошлым и текущим тиком (alpha от 0 до 1)"""
+        return (self.prev_x + (self.rect.x - self.prev_x) * alpha,
+                self.prev_y + (self.rect.y - self.prev_y) * alpha)
+
+# --- РЕЕСТР ИГРОКОВ ---
+class PlayerRegistry:
+    """Игроки партии: список Player и таблица клавиш для раскладок.
+
+    Состояние живет в самих Player (хитбокс - pygame.Rect); реестр дает
+    добавление с номером, таблицу клавиш (key_table) и ведет себя как
+    список: итерация, len() и индекс.
+    """
+    def __init__(self, players=()):
+        self.players = []
+        for p in players:
+            self.add(p)
+
+    def add(self, player):
+        """Добавляет игрока; возвращает его номер"""
+        self.players.append(player)
+        return len(self.players) - 1
+
+    def key_table(self):
+        """Клавиша -> ((игрок, действие), ...): одна проверка словаря на событие.
+
+        Игроки без keys (боты, сетевые) в таблицу не попадают.
+        """
+        table = {}
+        for p in self.players:
+            for action, keys in (p.keys or {}).items():
+                for key in keys:
+                    table.setdefault(key, []).append((p, action))
+        return {key: tuple(pairs) for key, pairs in table.items()}
+
+    def __iter__(self):
+        return iter(self.players)
+
+    def __len__(self):
+        return len(self.players)
+
+    def __getitem__(self, i):
+        return self.players[i]
+
+# --- ПРОВЕРКА ПРОХОДИМОСТИ ---
+class JumpEnvelope:
+    """Предрасчитанный прыжок с разбега: как далеко можно улететь на каждый перепад высот.
+
+    Траектория снимается один раз настоящим Player.update в пустом мире,
+    поэтому учитывает GRAVITY, JUMP_FORCE, MOVE_SPEED, предел скорости
+    падения и округление координат Rect. Правила столкновений те же, что в
+    Player.update: на соседнюю платформу можно заскочить только сверху -
+    если на тике входа в ее полосу по x низ игрока (по старой высоте) не
+    ниже ее верха, иначе горизонтальная коллизия отбрасывает назад.
+    """
+    def __init__(self, width=None):
+        if width is None:
+            width = min(w for w, _ in PLAYER_SIZES)
+        self.width = width
+
+        # dy[t] - смещение низа игрока через t тиков после прыжка (минус - вверх)
+        probe = Player(0, (width, PLAYER_SIZES[0][1]))
+        probe.on_ground = True
+        probe.try_jump()
+        empty = PlatformIndex()
+        dy = [0]
+        while dy[-1] <= SCREEN_HEIGHT:
+            probe.update(empty)
+            dy.append(probe.rect.bottom)
+        self.max_rise = -min(dy)
+
+        # last_tick[h - h_min] - последний тик s, на котором dy[s - 1] <= h.
+        # После вершины dy не убывает, так что ищем только на нисходящей ветви
+        self.h_min = -self.max_rise
+        self.last_tick = []
+        j = dy.index(self.h_min)
+        for h in range(self.h_min, SCREEN_HEIGHT + 1):
+            while j + 1 < len(dy) and dy[j + 1] <= h:
+                j += 1
+            self.last_tick.append(j + 1)
+
+    def max_gap(self, dh):
+        """Наибольший зазор между платформами при перепаде dh (плюс - вниз) или None.
+
+        Игрок шагает по MOVE_SPEED, поэтому у края платформы его левый край
+        гарантированно стоит не дальше MOVE_SPEED пикселей от края. Coyote
+        time не учитывается, так что оценка консервативная.
+        """
+        if dh < self.h_min:
+            return None
+        s = self.last_tick[min(dh, SCREEN_HEIGHT) - self.h_min]
+        # A.right - MOVE_SPEED + width + MOVE_SPEED * s > B.left
+        return self.width - MOVE_SPEED - 1 + MOVE_SPEED * s
+
+    def can_reach(self, a, b):
+        """Можно ли с платформы a допрыгнуть до платформы b справа"""
+        dh = b.top - a.top
+        if dh < self.h_min:
+            return False
+        # Стартуем не залезая под b: иначе в прыжке ударимся о нее головой.
+        # Во время прыжка можно придержать разбег и войти в полосу b позже
+        launch_right = min(a.right - MOVE_SPEED + self.width, b.left - MOVE_SPEED + 1)
+        s_needed = (b.left - launch_right) // MOVE_SPEED + 1
+        return s_needed <= self.last_tick[min(dh, SCREEN_HEIGHT) - self.h_min]
+
+JUMP_ENVELOPE = None
+
+def get_jump_envelope():
+    global JUMP_ENVELOPE
+    if JUMP_ENVELOPE is None:
+        JUMP_ENVELOPE = JumpEnvelope()
+    return JUMP_ENVELOPE
+
+def verify_level(level, envelope=None):
+    """Индексы платформ, с которых не допрыгнуть до следующей (пусто - уровень проходим)"""
+    envelope = envelope or get_jump_envelope()
+    rects = level.platforms.rects
+    can_reach = envelope.can_reach
+    return [i for i in range(len(rects) - 1) if not can_reach(rects[i], rects[i + 1])]
+
+# --- ГЕНЕРАЦИЯ УРОВНЯ ---
+class Level:
+    """Готовый уровень: индекс платформ, зона выхода, конец уровня и высота спауна"""
+    def __init__(self, platforms, exit_zone, end_x, spawn_y, seed=None, platform_count=None,
+                 spawn_points=None):
+        self.platforms = platforms
+        self.exit_zone = exit_zone
+        self.end_x = end_x
+        self.spawn_y = spawn_y
+        # [(x, низ)] по игрокам (по кругу) - у уровней из файла; иначе start_x и spawn_y
+        self.spawn_points = spawn_points
+        # По seed и platform_count уровень можно построить заново
+        self.seed = seed
+        self.platform_count = platform_count
+
+    def update(self, sim):
+        """Вызывается каждый тик; обычному уровню делать нечего"""
+
+def start_platform():
+    # Стартовая платформа - широкая и низкая
+    return pygame.Rect(50, GROUND_Y - 120, 450, 40)
+
+def place_platform(i, curr_x, curr_y, rng, envelope):
+    """Платформа номер i после края (curr_x, curr_y); сложность растет с i"""
+    # Ширина платформы - достаточная для приземления
+    w = rng.randint(180, 320)
+
+    # Расстояние - всегда проходимое (тест: jump_distance ~= 120-140px при vel=6)
+    gap = rng.randint(80, 160)
+
+    # Изменение высоты - контролируемое
+    # Максимальный прыжок вверх ~= 140px при JUMP_FORCE=-16
+    # Позволяем прыгать вниз свободно, вверх - ограниченно
+
+    if i < 3:
+        # Первые платформы - легкие
+        delta_h = rng.randint(-40, 20)
+    elif i < 8:
+        # Средние - разнообразные
+        delta_h = rng.randint(-80, 60)
+    else:
+        # Последние - сложнее
+        delta_h = rng.randint(-100, 80)
+
+    new_y = curr_y - delta_h
+
+    # Границы по высоте
+    new_y = max(100, min(new_y, GROUND_Y - 80))
+
+    # Проверка проходимости по вертикали
+    y_diff = abs(new_y - curr_y)
+    if new_y < curr_y and y_diff > 120:
+        # Слишком высоко - корректируем
+        new_y = curr_y - 110
+
+    # Проверка по реальной траектории прыжка: чиним, а не выбрасываем уровень
+    max_gap = envelope.max_gap(new_y - curr_y)
+    if max_gap is None:
+        new_y = curr_y + envelope.h_min
+        max_gap = envelope.max_gap(new_y - curr_y)
+    gap = min(gap, max_gap)
+
+    return pygame.Rect(curr_x + gap, new_y, w, 40)
+
+def generate_level(platform_count=15, rng=random, seed=None):
+    """ИСПРАВЛЕННАЯ генерация - интересные, но проходимые платформы.
+
+    С seed уровень строится своим random.Random(seed) и воспроизводим.
+    """
+    if seed is not None:
+        rng = random.Random(seed)
+    envelope = get_jump_envelope()
+    platforms = PlatformIndex()
+
+    start_plat = start_platform()
+    platforms.add(start_plat)
+
+    curr_x = start_plat.right
+    curr_y = start_plat.y
+
+    # ИСПРАВЛЕНИЕ: Генерация платформ с гарантией проходимости
+    for i in range(platform_count):
+        plat = place_platform(i, curr_x, curr_y, rng, envelope)
+        platforms.add(plat)
+        curr_x = plat.right
+        curr_y = plat.y
+
+    # Финишная платформа - большая и удобная
+    final_y = GROUND_Y - 130
+    final_gap = min(150, envelope.max_gap(final_y - curr_y) or 0)
+    final_plat = pygame.Rect(curr_x + final_gap, final_y, 500, 40)
+    platforms.add(final_plat)
+
+    exit_zone = pygame.Rect(final_plat.centerx - 60, final_plat.top - 120, 120, 120)
+
+    # Правильный респаун на СТАРТОВОЙ платформе
+    return Level(platforms, exit_zone, final_plat.right + 200, start_plat.top, seed, platform_count)
+
+# --- БЕСКОНЕЧНЫЙ РЕЖИМ ---
+ENDLESS_CHUNK = 8                   # платформ в одном чанке
+ENDLESS_AHEAD = SCREEN_WIDTH * 2    # насколько вперед от края экрана держим платформы
+ENDLESS_BEHIND = SCREEN_WIDTH       # насколько позади игроков и камеры их храним
+
+class EndlessLevel(Level):
+    """Бесконечный уровень: чанки платформ дописываются впереди камеры,
+    а оставшиеся далеко позади всех игроков выбрасываются.
+
+    Платформы идут по тем же ступеням сложности, что и в generate_level,
+    и одним random.Random(seed), поэтому уровень воспроизводим. Выхода нет,
+    platform_count = 0 отличает такой уровень в записях сессий.
+    """
+    def __init__(self, seed=None, chunk=ENDLESS_CHUNK):
+        start_plat = start_platform()
+        super().__init__(PlatformIndex([start_plat]), None, 0, start_plat.top, seed, 0)
+        self.rng = random.Random(seed)
+        self.envelope = get_jump_envelope()
+        self.chunk = chunk
+        self.placed = 0        # сколько платформ построено - по нему ступень сложности
+        self.evicted = 0       # сколько платформ выброшено
+        self.dropped_x = -SCREEN_WIDTH  # левее этого x платформ уже может не быть
+        self.curr_x = start_plat.right
+        self.curr_y = start_plat.y
+        self.extend(SCREEN_WIDTH + ENDLESS_AHEAD)
+
+    def extend(self, x):
+        """Достраивает чанки, пока край уровня не уйдет правее x"""
+        while self.curr_x < x:
+            for _ in range(self.chunk):
+                plat = place_platform(self.placed, self.curr_x, self.curr_y, self.rng, self.envelope)
+                self.platforms.add(plat)
+                self.curr_x = plat.right
+                self.curr_y = plat.y
+                self.placed += 1
+        # Камера упирается в край построенного, но он всегда впереди экрана
+        self.end_x = self.curr_x
+
+    def update(self, sim):
+        self.extend(sim.camera_x + SCREEN_WIDTH + ENDLESS_AHEAD)
+        behind = self.behind(sim)
+        self.evicted += self.platforms.drop_before(behind)
+        self.dropped_x = max(self.dropped_x, behind)
+
+    @staticmethod
+    def behind(sim):
+        return min(sim.camera_x, min(p.rect.x for p in sim.players)) - ENDLESS_BEHIND
+
+    def covers(self, sim):
+        """Есть ли еще все платформы, нужные партии в этом состоянии (после отката)"""
+        return self.dropped_x <= self.behind(sim)
+
+def level_seed(base_seed, index):
+    """Seed уровня номер index партии с базовым seed.
+
+    Уровень задается номером, а не позицией в потоке случайных чисел, поэтому
+    откат к снимку и повторный респаун дают тот же уровень.
+    """
+    return (base_seed + index * 0x9E3779B9) & 0xFFFFFFFF
+
+def base_seed(seed):
+    return random.Random(seed).getrandbits(32)
+
+class EndlessLevels:
+    """Источник уровней для Simulation: новый бесконечный уровень на каждый респаун"""
+    def __init__(self, seed=None):
+        self.base_seed = base_seed(seed)
+
+    def take(self, index):
+        return EndlessLevel(level_seed(self.base_seed, index))
+
+    def close(self):
+        pass
+
+def build_level(seed, platform_count):
+    """Строит уровень заново по seed и platform_count (0 - бесконечный)"""
+    if platform_count == 0:
+        return EndlessLevel(seed)
+    return generate_level(platform_count, seed=seed)
+
+class LevelPrefetcher:
+    """Строит следующий уровень в фоновом потоке, пока играется текущий.
+
+    Seed уровня зависит только от seed партии и номера уровня (level_seed),
+    поэтому последовательность воспроизводима независимо от того, когда
+    поток успел их построить.
+    """
+    def __init__(self, platform_count=15, seed=None):
+        self.platform_count = platform_count
+        self.base_seed = base_seed(seed)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-prefetch")
+        self.pending = None
+        self.pending_index = 0
+        self.schedule(0)
+
+    def schedule(self, index):
+        seed = level_seed(self.base_seed, index)
+        self.pending = self.executor.submit(generate_level, self.platform_count, seed=seed)
+        self.pending_index = index
+
+    def take(self, index):
+        """Забирает готовый уровень номер index и сразу заказывает следующий"""
+        if index != self.pending_index:
+            # Откат к снимку на другом уровне: строим нужный здесь же
+            self.schedule(index)
+        # Обычно уровень давно построен и result() возвращается мгновенно
+        level = self.pending.result()
+        self.schedule(index + 1)
+        return level
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# --- СИМУЛЯЦИЯ ---
+RECENT_LEVELS = 4   # недавних уровней в памяти для отката (restore)
+STATE_STRUCTS = {}
+
+def state_struct(players):
+    """struct снимка для числа игроков (кэшируется)"""
+    st = STATE_STRUCTS.get(players)
+    if st is None:
+        st = STATE_STRUCTS[players] = struct.Struct("<" + SIM_STATE + PLAYER_STATE * players)
+    return st
+
+def snapshot_diff(a, b, players):
+    """Поля, которыми различаются два снимка: [(поле, было, стало)]"""
+    st = state_struct(players)
+    names = list(SIM_FIELDS) + [f"p{i}.{name}" for i in range(players) for name in PLAYER_FIELDS]
+    return [(name, x, y) for name, x, y in zip(names, st.unpack(a), st.unpack(b)) if x != y]
+
+class Simulation:
+    """Состояние партии и шаг логики; отрисовка только читает это состояние"""
+    def __init__(self, players=None, platform_count=15, rng=random, levels=None, swept=False):
+        if players is None:
+            players = [Player(x, size) for x, size in zip(PLAYER_START_X, PLAYER_SIZES)]
+        if not isinstance(players, PlayerRegistry):
+            players = PlayerRegistry(players)
+        self.players = players
+        self.platform_count = platform_count
+        # Сплошные коллизии (Player.update_swept) и на обычном тике; шаг больше
+        # тика идет через них всегда. Запись, сеть и проверка уровней - на update
+        self.swept = swept
+        self.rng = rng
+        # Источник заранее построенных уровней (LevelPrefetcher) или None;
+        # уровни запрашиваются по номеру, номер входит в снимок
+        self.levels = levels
+        self.base_seed = rng.getrandbits(32)
+        self.level_index = -1
+        # Запись ввода (replay.InputRecorder) или None
+        self.recorder = None
+        # Последние уровни по (seed, platform_count): откат через смерть их не перестраивает
+        self.recent_levels = OrderedDict()
+        self.state_struct = state_struct(len(self.players))
+        self.camera_x = 0.0
+        self.prev_camera_x = 0.0
+        self.tick = 0
+        self.deaths = 0
+        self.won = False
+        self.new_level()
+
+    def new_level(self, level=None):
+        """Ставит новый уровень (или сгенерированный заранее) и респаунит игроков"""
+        self.level_index += 1
+        if level is None:
+            if self.levels is not None:
+                level = self.levels.take(self.level_index)
+            else:
+                # Свой seed у каждого уровня - его можно построить заново по снимку
+                level = generate_level(self.platform_count, seed=level_seed(self.base_seed, self.level_index))
+        self.level = level
+        if level.seed is not None:
+            self.recent_levels[(level.seed, level.platform_count or 0)] = level
+            if len(self.recent_levels) > RECENT_LEVELS:
+                self.recent_levels.popitem(last=False)
+        self.won = False
+        spawns = level.spawn_points
+        for i, p in enumerate(self.players):
+            if spawns:
+                x, y = spawns[i % len(spawns)]
+                p.reset(y, x)
+            else:
+                p.reset(level.spawn_y)
+        if self.recorder is not None:
+            self.recorder.level_started(level)
+
+    @property
+    def platforms(self):
+        return self.level.platforms
+
+    @property
+    def exit_zone(self):
+        return self.level.exit_zone
+
+    def step(self, dt=1):
+        """Один шаг логики на dt тиков; возвращает флаги движения игроков для анимации"""
+        self.prev_camera_x = self.camera_x
+        swept = self.swept or dt != 1
+        if self.recorder is not None:
+            if dt != 1:
+                raise ValueError("запись ввода идет по одному тику (dt=1)")
+            self.recorder.record([p.input_bits() for p in self.players])
+        # Один проход по игрокам: физика, сумма для камеры,
+        # смерть в лаве и все ли в зоне выхода
+        players = self.players
+        platforms = self.level.platforms
+        exit_zone = self.level.exit_zone
+        death_y = GROUND_Y + 50
+        moving = []
+        total_x = 0
+        dead = False
+        in_exit = exit_zone is not None
+        for p in players.players:
+            p.jump_pressed = False
+            moving.append(p.update_swept(platforms, dt) if swept else p.update(platforms))
+            rect = p.rect
+            total_x += rect.centerx
+            if rect.top > death_y:
+                dead = True
+            elif in_exit and not rect.colliderect(exit_zone):
+                in_exit = False
+
+        # Смерть в лаве: новый уровень, камера и выход - по точкам респауна
+        if dead:
+            self.deaths += 1
+            self.new_level()
+            exit_zone = self.level.exit_zone
+            total_x = sum(p.rect.centerx for p in players)
+            in_exit = exit_zone is not None and all(p.rect.colliderect(exit_zone) for p in players)
+
+        # Плавная камера
+        target_cam = total_x / len(players) - SCREEN_WIDTH / 2
+        target_cam = max(0.0, min(target_cam, self.level.end_x - SCREEN_WIDTH))
+        self.camera_x += (target_cam - self.camera_x) * (0.12 if dt == 1 else 1 - 0.88 ** dt)
+
+        # Бесконечный уровень дописывает и выбрасывает платформы
+        self.level.update(self)
+
+        # Победа
+        if in_exit:
+            self.won = True
+
+        self.tick += dt
+        if self.recorder is not None:
+            self.recorder.tick_done(self)
+        return moving
+
+    # --- СНИМКИ ---
+    def snapshot(self):
+        """Состояние партии в байтах фиксированного размера (state_struct)"""
+        level = self.level
+        seeded = level.seed is not None
+        values = [self.camera_x, self.prev_camera_x, self.tick, self.deaths, self.won, self.level_index,
+                  seeded, level.seed if seeded else 0, (level.platform_count or 0) if seeded else 0]
+        for p in self.players:
+            values.extend(p.get_state())
+        return self.state_struct.pack(*values)
+
+    def restore(self, data):
+        """Возвращает партию к снимку; уровень берется из недавних или строится по seed"""
+        values = self.state_struct.unpack(data)
+        self.camera_x, self.prev_camera_x, self.tick, self.deaths, won, \
+            self.level_index, seeded, seed, platform_count = values[:9]
+        self.won = bool(won)
+        level = self.level
+        if not seeded:
+            # Уровень без seed не построить заново - откат только в пределах него
+            if level.seed is not None:
+                raise ValueError("снимок сделан на уровне без seed, а текущий уровень другой")
+        elif (level.seed, level.platform_count or 0) != (seed, platform_count):
+            level = self.recent_levels.get((seed, platform_count))
+            if level is None:
+                level = build_level(seed, platform_count)
+            self.level = level
+        n = len(PLAYER_FIELDS)
+        for i, p in enumerate(self.players):
+            p.set_state(values[9 + i * n:9 + (i + 1) * n])
+        if isinstance(self.level, EndlessLevel):
+            # Бесконечный уровень мог уже выбросить платформы позади точки отката
+            if not self.level.covers(self):
+                self.level = build_level(seed, platform_count)
+                self.recent_levels[(seed, platform_count)] = self.level
+            self.level.update(self)
+
+    def camera_at(self, alpha):
+        """Камера между прошлым и текущим тиком (alpha от 0 до 1)"""
+        return self.prev_camera_x + (self.camera_x - self.prev_camera_x) * alpha
+
+    def run(self, ticks, controller=None, dt=1):
+        """Гоняет логику без ограничения FPS до победы или лимита тиков.
+
+        controller(sim) вызывается перед каждым шагом и выставляет флаги
+        moving_left/moving_right и прыжки игроков. dt > 1 - шаги по dt тиков
+        со сплошными коллизиями. Возвращает число тиков.
+        """
+        start_tick = self.tick
+        while self.tick - start_tick < ticks and not self.won:
+            if controller is not None:
+                controller(self)
+            self.step(min(dt, ticks - (self.tick - start_tick)))
+        return self.tick - start_tick
+
+# --- ФИКСИРОВАННЫЙ ШАГ ---
+class FixedTimestep:
+    """Аккумулятор реального времени: сколько тиков логики выполнить за кадр"""
+    def __init__(self, tick_rate=TICK_RATE, max_substeps=MAX_SUBSTEPS):
+        self.dt = 1.0 / tick_rate
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0
+        self.dropped_ticks = 0
+
+    def advance(self, frame_time):
+        """Добавляет время кадра (сек) и возвращает число тиков к выполнению"""
+        self.accumulator += frame_time
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_substeps:
+            # Не пытаемся догнать весь провал - иначе каждый следующий кадр
+            # будет еще дольше. Лишнее время выбрасываем, дробная часть остается
+            self.dropped_ticks += ticks - self.max_substeps
+            ticks = self.max_substeps
+            self.accumulator %= self.dt
+        else:
+            self.accumulator -= ticks * self.dt
+        return ticks
+
+    @property
+    def alpha(self):
+        """Доля следующего тика, уже набежавшая в аккумуляторе"""
+        return self.accumulator / self.dt
+
+# --- АВТОИГРОК ---
+def edge_jump_bot(sim, players=None):
+    """Простейший бот: бежит вправо и прыгает у края платформы.
+
+    players - кем управлять (по умолчанию всеми игроками партии)
+    """
+    for p in sim.players if players is None else players:
+        p.moving_right = True
+        if p.on_ground:
+            ahead = pygame.Rect(p.rect.right + MOVE_SPEED * 2, p.rect.bottom, 1, 1)
+            if not any(ahead.colliderect(r) for r in sim.platforms.query(ahead.left, ahead.right)):
+                p.try_jump()
+
+def verify_seeds(count, first_seed=0, platform_count=15):
+    """Пакетная проверка уровней по сидам; возвращает сиды непроходимых уровней"""
+    envelope = get_jump_envelope()
+    return [seed for seed in range(first_seed, first_seed + count)
+            if verify_level(generate_level(platform_count, seed=seed), envelope)]
+
+if __name__ == "__main__" and "--verify" in sys.argv:
+    # Проверка проходимости: python simulation.py --verify [уровней] [первый сид]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    count = int(args[0]) if args else 10000
+    first = int(args[1]) if len(args) > 1 else 0
+    level = generate_level(seed=first)
+    get_jump_envelope()
+    start = time.perf_counter()
+    for _ in range(1000):
+        verify_level(level)
+    per_level = (time.perf_counter() - start) / 1000 * 1e6
+    start = time.perf_counter()
+    bad = verify_seeds(count, first)
+    elapsed = time.perf_counter() - start
+    print(f"verify_level: {per_level:.1f} us per level ({len(level.platforms)} platforms)")
+    print(f"{count} seeds in {elapsed:.2f} s, unreachable: {len(bad)} {bad[:10]}")
+
+elif __name__ == "__main__":
+    # Быстрый прогон без окна: python simulation.py [тиков] [сид] [--dt N] [--swept]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    dt = int(sys.argv[sys.argv.index("--dt") + 1]) if "--dt" in sys.argv else 1
+    if "--dt" in sys.argv:
+        args.remove(str(dt))
+    ticks = int(args[0]) if args else 100000
+    seed = int(args[1]) if len(args) > 1 else 0
+    sim = Simulation(rng=random.Random(seed), swept="--swept" in sys.argv)
+    done = 0
+    wins = 0
+    start = time.perf_counter()
+    while done < ticks:
+        done += sim.run(ticks - done, edge_jump_bot, dt)
+        if sim.won:
+            wins += 1
+            sim.new_level()
+    elapsed = time.perf_counter() - start
+    print(f"{done} ticks in {elapsed:.2f} s: {done / elapsed:.0f} ticks/s, wins: {wins}, deaths: {sim.deaths}")
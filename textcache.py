@@ -0,0 +1,95 @@
+"""Шрифты и кэш отрисованного текста для меню, HUD и отладочного оверлея.
+
+Готовые строки хранятся в LRU по ключу (шрифт, строка, цвет, сглаживание):
+статичный текст растеризуется один раз, дальше кадр стоит одного blit'а.
+Строки с меняющимися числами просто проходят через LRU и вытесняются, не
+мешая статичным строкам, которые используются каждый кадр.
+
+Шрифты создаются при первом использовании. Поиск файла шрифта (SysFont на
+Linux опрашивает fc-list) делается один раз, найденный путь сохраняется
+на диск рядом с атласом спрайтов, и следующие запуски поиск пропускают.
+"""
+import os
+import json
+from collections import OrderedDict
+
+import pygame
+
+from assets import CACHE_DIR
+
+TEXT_CACHE_SIZE = 256
+FONT_PATHS_FILE = os.path.join(CACHE_DIR, "fonts.json")
+
+# --- ШРИФТЫ ---
+fonts = {}          # (имена, размер, жирный) -> Font
+font_paths = None  # "имена|жирный" -> [путь, искусственный жирный]; читается с диска
+
+def find_font(names, bold):
+    """Путь к файлу шрифта и нужен ли искусственный жирный - как у SysFont"""
+    global font_paths
+    if font_paths is None:
+        try:
+            with open(FONT_PATHS_FILE, encoding="utf-8") as f:
+                font_paths = json.load(f)
+        except (OSError, ValueError):
+            font_paths = {}
+    key = f"{names}|{int(bold)}"
+    cached = font_paths.get(key)
+    if cached is not None and os.path.exists(cached[0]):
+        return cached
+
+    path = pygame.font.match_font(names, bold=bold)
+    if path is None:
+        # Шрифт не найден: встроенный шрифт pygame, жирность - программно
+        return None, bold
+    fake_bold = bold and path == pygame.font.match_font(names)
+    font_paths[key] = [path, fake_bold]
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(FONT_PATHS_FILE, "w", encoding="utf-8") as f:
+            json.dump(font_paths, f)
+    except OSError:
+        pass
+    return path, fake_bold
+
+def get_font(names, size, bold=False):
+    """Шрифт по списку имен через запятую (как SysFont), создается при первом вызове"""
+    key = (names, size, bold)
+    font = fonts.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        path, fake_bold = find_font(names, bold)
+        font = fonts[key] = pygame.font.Font(path, size)
+        font.bold = fake_bold
+    return font
+
+# --- КЭШ ТЕКСТА ---
+class TextCache:
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (шрифт, строка, цвет, сглаживание) -> Surface
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        """Как font.render, но каждая строка растеризуется один раз"""
+        key = (font, text, tuple(color), antialias)
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surf
+        self.misses += 1
+        surf = self.entries[key] = font.render(text, antialias, color)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surf
+
+    def draw(self, surface, font, text, color, pos, antialias=True):
+        """Рисует строку из кэша и возвращает ее ширину"""
+        surf = self.render(font, text, color, antialias)
+        surface.blit(surf, pos)
+        return surf.get_width()
+
+text_cache = TextCache()